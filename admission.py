@@ -0,0 +1,111 @@
+import math
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable
+
+# Number of answers (retrieval plus LLM call) allowed to run at the same time
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+# Number of requests allowed to wait for a free slot before new ones are turned away
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+
+# Seconds a request may wait for a free slot before it is turned away
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is turned away instead of being queued for the LLM.
+
+    Attributes:
+        status_code (int): 429 when the queue is full, 503 when the queue deadline passed.
+        retry_after (int): Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls sharing a key: the first caller runs the function and
+    every caller that arrives while it is in flight gets the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AdmissionController:
+    """
+    Bounds the number of concurrent calls and the number of callers waiting for one,
+    rejecting the rest quickly instead of letting them pile up.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._waiting = 0
+
+    @contextmanager
+    def admit(self):
+        """
+        Holds a concurrency slot for the duration of the block.
+
+        Raises:
+            AdmissionRejected: If the queue is full or no slot freed up before the deadline.
+        """
+        retry_after = max(1, math.ceil(self.queue_timeout))
+
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                raise AdmissionRejected("Too many requests are waiting, please retry later", 429, retry_after)
+            self._waiting += 1
+
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        if not acquired:
+            raise AdmissionRejected("The service is busy, please retry later", 503, retry_after)
+
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+
+# Shared by every /response call
+response_flights = SingleFlight()
+llm_admission = AdmissionController(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT)
@@ -0,0 +1,153 @@
+import re
+import sqlite3
+from typing import List
+
+# Largest page the search endpoint returns
+MAX_PAGE_SIZE = 100
+
+# External-content FTS5 index over chat_history; user_id is indexed too so a user's
+# search only walks that user's posting lists
+CREATE_FTS_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_fts USING fts5(
+        question, answer, user_id,
+        content='chat_history', content_rowid='uid',
+        tokenize='porter unicode61'
+    )
+"""
+
+# Keep the index in sync with every write to chat_history, whatever the write path
+CREATE_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_history_fts_insert AFTER INSERT ON chat_history BEGIN
+        INSERT INTO chat_history_fts (rowid, question, answer, user_id)
+        VALUES (new.uid, new.question, new.answer, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_history_fts_delete AFTER DELETE ON chat_history BEGIN
+        INSERT INTO chat_history_fts (chat_history_fts, rowid, question, answer, user_id)
+        VALUES ('delete', old.uid, old.question, old.answer, old.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_history_fts_update AFTER UPDATE ON chat_history BEGIN
+        INSERT INTO chat_history_fts (chat_history_fts, rowid, question, answer, user_id)
+        VALUES ('delete', old.uid, old.question, old.answer, old.user_id);
+        INSERT INTO chat_history_fts (rowid, question, answer, user_id)
+        VALUES (new.uid, new.question, new.answer, new.user_id);
+    END
+    """,
+]
+
+# Matches in the question weigh twice as much as matches in the answer
+SEARCH_QUERY = """
+    SELECT h.uid, h.chat_id, h.question, h.time_stamp,
+           snippet(chat_history_fts, -1, '[', ']', '...', 16) AS snippet,
+           bm25(chat_history_fts, 2.0, 1.0, 0.0) AS score
+    FROM chat_history_fts
+    JOIN chat_history h ON h.uid = chat_history_fts.rowid
+    WHERE chat_history_fts MATCH ?
+    ORDER BY score
+    LIMIT ? OFFSET ?
+"""
+
+
+def ensure_chat_history_fts(connection: sqlite3.Connection) -> bool:
+    """
+    Creates the FTS5 index over chat_history and its sync triggers, indexing existing rows.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database.
+
+    Returns:
+        bool: False if the database has no chat_history table to index yet.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_history'")
+    if cursor.fetchone() is None:
+        cursor.close()
+        return False
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'chat_history_fts'")
+    exists = cursor.fetchone() is not None
+
+    cursor.execute(CREATE_FTS_TABLE)
+    for trigger in CREATE_FTS_TRIGGERS:
+        cursor.execute(trigger)
+
+    if not exists:
+        cursor.execute("INSERT INTO chat_history_fts (chat_history_fts) VALUES ('rebuild')")
+
+    connection.commit()
+    cursor.close()
+    return True
+
+
+def build_match_expression(user_id, query: str) -> str:
+    """
+    Turns free text into an FTS5 expression matching every word, scoped to one user.
+
+    Words are quoted, so FTS5 operators typed by the user are searched for literally.
+
+    Args:
+        user_id: The user whose history is searched.
+        query (str): The text typed by the user.
+
+    Returns:
+        str: The FTS5 MATCH expression, or an empty string if the query has no words.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return ""
+
+    terms = " ".join(f'"{word}"' for word in words)
+    return f'user_id : "{int(user_id)}" AND {{question answer}} : ({terms})'
+
+
+def empty_results(page: int = 1, page_size: int = 20) -> dict:
+    """
+    Returns a page without results, in the shape search_chat_history returns.
+    """
+    page = max(1, page)
+    page_size = min(max(1, page_size), MAX_PAGE_SIZE)
+    return {"results": [], "page": page, "page_size": page_size, "has_more": False}
+
+
+def search_chat_history(connection: sqlite3.Connection, user_id, query: str, page: int = 1,
+                        page_size: int = 20) -> dict:
+    """
+    Ranks a user's past questions and answers against a query.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database.
+        user_id: The user whose history is searched.
+        query (str): The text to search for.
+        page (int, optional): The 1-based page number.
+        page_size (int, optional): Results per page, at most MAX_PAGE_SIZE.
+
+    Returns:
+        dict: The page of results and whether more pages follow.
+    """
+    page = max(1, page)
+    page_size = min(max(1, page_size), MAX_PAGE_SIZE)
+
+    expression = build_match_expression(user_id, query)
+    if not expression:
+        return empty_results(page, page_size)
+
+    cursor = connection.cursor()
+    # Fetch one extra row to know whether another page follows
+    cursor.execute(SEARCH_QUERY, (expression, page_size + 1, (page - 1) * page_size))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    results: List[dict] = [{
+        "id": row[0],
+        "chat_id": row[1],
+        "question": row[2],
+        "timestamp": row[3],
+        "snippet": row[4],
+        "score": row[5]
+    } for row in rows[:page_size]]
+
+    return {"results": results, "page": page, "page_size": page_size, "has_more": len(rows) > page_size}
@@ -0,0 +1,156 @@
+import hashlib
+import os
+import re
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+# Chunks whose 64-bit SimHash fingerprints differ in at most this many bits are near-duplicates
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "3"))
+
+# Words per shingle hashed into the fingerprint
+SHINGLE_SIZE = 3
+
+# Rough characters per embedding token, used to report the tokens a dropped chunk saved
+CHARS_PER_TOKEN = 4
+
+# Metadata key listing the other sources ({"chat_num", "source"}) whose near-duplicate of a
+# chunk was dropped in favour of it; deleting the chunk's own source hands it over to them
+DUPLICATE_SOURCES = "duplicate_sources"
+
+# Fingerprints are split into this many bands; two fingerprints within DEDUP_MAX_DISTANCE
+# bits share at least one band as long as DEDUP_MAX_DISTANCE < SIMHASH_BANDS
+SIMHASH_BANDS = 4
+
+
+def simhash(text: str) -> int:
+    """
+    Computes the 64-bit SimHash fingerprint of a text from its word shingles.
+
+    Texts that share most of their shingles get fingerprints that differ in few bits.
+
+    Args:
+        text (str): The text to fingerprint.
+
+    Returns:
+        int: The fingerprint.
+    """
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(shingles), 8), axis=1)
+
+    # A bit is set when most shingle hashes have it set
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big")
+
+
+class SimHashIndex:
+    """
+    Finds fingerprints within DEDUP_MAX_DISTANCE bits of a query without comparing against
+    all of them: only fingerprints sharing one of the query's bands are checked.
+
+    Every fingerprint is stored with a key identifying the chunk it belongs to.
+    """
+
+    def __init__(self, fingerprints: Optional[Dict[Hashable, int]] = None, max_distance: int = DEDUP_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._bands: Dict[Tuple[int, int], List[Tuple[int, Any]]] = {}
+        for key, fingerprint in (fingerprints or {}).items():
+            self.add(fingerprint, key)
+
+    @staticmethod
+    def _band_keys(fingerprint: int):
+        width = 64 // SIMHASH_BANDS
+        for band in range(SIMHASH_BANDS):
+            yield band, (fingerprint >> (band * width)) & ((1 << width) - 1)
+
+    def add(self, fingerprint: int, key: Any) -> None:
+        for band_key in self._band_keys(fingerprint):
+            self._bands.setdefault(band_key, []).append((fingerprint, key))
+
+    def find_near_duplicate(self, fingerprint: int) -> Optional[Any]:
+        """
+        Returns the key of a stored fingerprint within max_distance bits, or None.
+        """
+        for band_key in self._band_keys(fingerprint):
+            for candidate, key in self._bands.get(band_key, ()):
+                if bin(fingerprint ^ candidate).count("1") <= self.max_distance:
+                    return key
+        return None
+
+
+def duplicate_source(doc: Document) -> dict:
+    """
+    Returns the reference to a dropped chunk's source stored in DUPLICATE_SOURCES.
+    """
+    return {"chat_num": doc.metadata.get("chat_num"), "source": doc.metadata.get("source")}
+
+
+def add_duplicate_sources(metadata: dict, sources: List[dict]) -> bool:
+    """
+    Adds sources to a chunk's DUPLICATE_SOURCES, skipping its own source and known ones.
+
+    Returns:
+        bool: Whether the metadata changed.
+    """
+    duplicates = metadata.get(DUPLICATE_SOURCES, [])
+    known = {str(metadata.get("chat_num"))} | {str(source["chat_num"]) for source in duplicates}
+
+    added = []
+    for source in sources:
+        if str(source["chat_num"]) not in known:
+            known.add(str(source["chat_num"]))
+            added.append(source)
+
+    if added:
+        metadata[DUPLICATE_SOURCES] = duplicates + added
+    return bool(added)
+
+
+def deduplicate_chunks(docs: List[Document], existing_fingerprints: Dict[str, int]
+                       ) -> Tuple[List[Document], dict, Dict[str, List[dict]]]:
+    """
+    Drops chunks that near-duplicate a chunk already indexed or an earlier chunk of the batch.
+
+    Kept chunks get their fingerprint stored in metadata["simhash"], so later ingests do not
+    have to recompute it. When the dropped chunk comes from another source than the chunk it
+    duplicates, that source is recorded on the surviving chunk (see DUPLICATE_SOURCES): directly
+    for a chunk of the batch, in the returned references for an indexed one.
+
+    Args:
+        docs (List[Document]): The chunks about to be embedded.
+        existing_fingerprints (Dict[str, int]): Fingerprints of the chunks already indexed,
+            keyed by docstore id.
+
+    Returns:
+        Tuple[List[Document], dict, Dict[str, List[dict]]]: The chunks to embed, how many
+        chunks and (estimated) embedding tokens were saved, and the sources to record on
+        indexed chunks, keyed by docstore id.
+    """
+    index = SimHashIndex(existing_fingerprints)
+    kept, dropped_chars, references = [], 0, {}
+
+    for doc in docs:
+        fingerprint = simhash(doc.page_content)
+        match = index.find_near_duplicate(fingerprint)
+        if match is not None:
+            dropped_chars += len(doc.page_content)
+            if isinstance(match, int):
+                add_duplicate_sources(kept[match].metadata, [duplicate_source(doc)])
+            else:
+                references.setdefault(match, []).append(duplicate_source(doc))
+            continue
+
+        # Chunks of the batch are keyed by their position in `kept`, indexed ones by docstore id
+        index.add(fingerprint, len(kept))
+        doc.metadata["simhash"] = fingerprint
+        kept.append(doc)
+
+    return kept, {
+        "chunks_total": len(docs),
+        "chunks_dropped": len(docs) - len(kept),
+        "tokens_saved": dropped_chars // CHARS_PER_TOKEN
+    }, references
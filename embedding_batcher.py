@@ -0,0 +1,164 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+# Largest number of texts sent in one provider call (Google caps batches at 100)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+
+# How long the first text of a batch may wait for others to join it
+EMBED_BATCH_WAIT = float(os.getenv("EMBED_BATCH_WAIT_MS", "20")) / 1000
+
+# Retries of a failed provider call (rate limit, outage, timeout) before its callers get the error
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+
+# Base delay of the exponential backoff between retries, in seconds
+EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", "0.5"))
+
+# Provider calls allowed in flight at the same time
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+
+# Times a batch the provider rejects for its input may be halved to isolate the bad texts;
+# with the defaults a batch costs at most 31 calls and a bad text fails at most 7 texts
+EMBED_MAX_SPLIT_DEPTH = int(os.getenv("EMBED_MAX_SPLIT_DEPTH", "4"))
+
+# HTTP status of the errors caused by the texts themselves (Google's InvalidArgument)
+INPUT_ERROR_STATUS = 400
+
+# Task type the provider uses for query embeddings, documents use the provider default
+QUERY_TASK_TYPE = "RETRIEVAL_QUERY"
+
+
+def is_input_error(error: BaseException) -> bool:
+    """
+    Tells whether the provider rejected the texts themselves (HTTP 400, invalid argument),
+    as opposed to a rate limit, an outage or a timeout, which sending fewer texts does not fix.
+
+    The provider wraps its client errors, so the whole chain of causes is checked.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if INPUT_ERROR_STATUS in (getattr(error, "code", None), getattr(error, "status_code", None)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class EmbeddingBatcher(Embeddings):
+    """
+    Embeddings wrapper that merges texts from concurrent callers into shared provider calls.
+
+    Texts are queued per task type; a batch is sent once it holds `max_batch_size` texts or
+    its oldest text has waited `max_wait` seconds. Each caller then gets back exactly the
+    vectors for its own texts.
+
+    A call failing on a rate limit, an outage or a timeout is retried with exponential backoff,
+    then the error goes to every caller of the batch. A call rejected because of its input is
+    split in halves instead (at most `max_split_depth` times), so only the callers whose texts
+    the provider rejects see an error.
+    """
+
+    def __init__(self, provider: Embeddings, max_batch_size: int = EMBED_BATCH_SIZE,
+                 max_wait: float = EMBED_BATCH_WAIT, max_retries: int = EMBED_MAX_RETRIES,
+                 retry_backoff: float = EMBED_RETRY_BACKOFF, max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+                 max_split_depth: int = EMBED_MAX_SPLIT_DEPTH):
+        self.provider = provider
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_split_depth = max_split_depth
+
+        # task_type -> deque of (enqueue time, text, future)
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed-batch")
+        self._collector = threading.Thread(target=self._collect, name="embed-collector", daemon=True)
+        self._collector.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        futures = self._submit(texts, None)
+        return [future.result() for future in futures]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text], QUERY_TASK_TYPE)[0].result()
+
+    def _submit(self, texts: List[str], task_type: Optional[str]) -> List[Future]:
+        now = time.monotonic()
+        futures = [Future() for _ in texts]
+
+        with self._condition:
+            lane = self._pending.setdefault(task_type, deque())
+            lane.extend((now, text, future) for text, future in zip(texts, futures))
+            self._condition.notify()
+
+        return futures
+
+    def _collect(self) -> None:
+        while True:
+            with self._condition:
+                batch, task_type = self._next_batch()
+                while batch is None:
+                    self._condition.wait(timeout=self._time_to_deadline())
+                    batch, task_type = self._next_batch()
+
+            self._pool.submit(self._dispatch, batch, task_type)
+
+    def _next_batch(self):
+        # Called with the condition held: pop a full batch, or the batch whose wait is over
+        now = time.monotonic()
+        for task_type, lane in self._pending.items():
+            if len(lane) >= self.max_batch_size or (lane and now - lane[0][0] >= self.max_wait):
+                batch = [lane.popleft() for _ in range(min(self.max_batch_size, len(lane)))]
+                return batch, task_type
+        return None, None
+
+    def _time_to_deadline(self) -> Optional[float]:
+        oldest = [lane[0][0] for lane in self._pending.values() if lane]
+        if not oldest:
+            return None
+        return max(0.0, min(oldest) + self.max_wait - time.monotonic())
+
+    def _dispatch(self, batch: list, task_type: Optional[str], depth: int = 0) -> None:
+        texts = [text for _, text, _ in batch]
+
+        try:
+            vectors = self._embed_with_retry(texts, task_type, self.max_retries)
+        except Exception as e:
+            if len(batch) == 1 or depth >= self.max_split_depth or not is_input_error(e):
+                # Splitting on a rate limit or an outage would only multiply the failing calls
+                for _, _, future in batch:
+                    future.set_exception(e)
+                return
+
+            # Split the batch so one bad text does not fail everybody else's embeddings
+            middle = len(batch) // 2
+            self._dispatch(batch[:middle], task_type, depth + 1)
+            self._dispatch(batch[middle:], task_type, depth + 1)
+            return
+
+        for (_, _, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def _embed_with_retry(self, texts: List[str], task_type: Optional[str], retries: int) -> List[List[float]]:
+        for attempt in range(retries + 1):
+            try:
+                if task_type is None:
+                    vectors = self.provider.embed_documents(texts)
+                else:
+                    vectors = self.provider.embed_documents(texts, task_type=task_type)
+
+                if len(vectors) != len(texts):
+                    raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+                return vectors
+            except Exception as e:
+                # Retrying the same texts cannot fix an input error
+                if attempt == retries or is_input_error(e):
+                    raise
+                time.sleep(self.retry_backoff * 2 ** attempt * (1 + random.random()))
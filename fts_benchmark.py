@@ -0,0 +1,125 @@
+"""
+Benchmarks chat history search: FTS5 (chat_search) against the LIKE scan it replaces.
+
+Builds a synthetic chat_history in a temporary SQLite database, then times the same
+single-user, two-word queries through both paths.
+
+Usage:
+    python fts_benchmark.py [--rows 200000] [--users 1000] [--queries 200]
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from chat_search import ensure_chat_history_fts, search_chat_history
+
+CREATE_CHAT_HISTORY = """
+    CREATE TABLE chat_history (
+        uid INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        question VARCHAR(255) NOT NULL,
+        answer VARCHAR(255) NOT NULL,
+        time_stamp DATETIME,
+        PRIMARY KEY (uid)
+    )
+"""
+
+LIKE_QUERY = """
+    SELECT uid, chat_id, question, time_stamp
+    FROM chat_history
+    WHERE user_id = ?
+      AND (question LIKE ? OR answer LIKE ?)
+      AND (question LIKE ? OR answer LIKE ?)
+    LIMIT 20
+"""
+
+
+def build_database(path: str, rows: int, users: int, seed: int = 0) -> list:
+    """
+    Fills a fresh database with synthetic questions and answers.
+
+    Returns:
+        list: The vocabulary the texts were drawn from.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(20000)]
+    # Zipf-like word frequencies, as in natural text
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    connection = sqlite3.connect(path)
+    connection.execute(CREATE_CHAT_HISTORY)
+    ensure_chat_history_fts(connection)
+
+    batch = []
+    for uid in range(1, rows + 1):
+        question = " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=12))
+        answer = " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=80))
+        batch.append((uid, rng.randint(1, users), uid // 10, question, answer, "2024-01-01 00:00:00"))
+        if len(batch) == 10000:
+            connection.executemany("INSERT INTO chat_history VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        connection.executemany("INSERT INTO chat_history VALUES (?, ?, ?, ?, ?, ?)", batch)
+    connection.commit()
+    connection.close()
+
+    return vocabulary
+
+
+def time_queries(run, queries: list) -> list:
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        run(*query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list) -> None:
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:>5}: mean {statistics.mean(timings):8.2f} ms   p50 {statistics.median(timings):8.2f} ms"
+          f"   p95 {p95:8.2f} ms")
+
+
+def main(rows: int, users: int, num_queries: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "chat_history.sqlite3")
+
+        start = time.perf_counter()
+        vocabulary = build_database(path, rows, users)
+        print(f"Built {rows} rows for {users} users in {time.perf_counter() - start:.1f} s")
+
+        rng = random.Random(1)
+        # Mid-frequency words, like the topics users search their history for
+        queries = [(rng.randint(1, users), rng.choice(vocabulary[100:2000]), rng.choice(vocabulary[100:2000]))
+                   for _ in range(num_queries)]
+
+        connection = sqlite3.connect(path)
+
+        def like_search(user_id, first, second):
+            connection.execute(LIKE_QUERY, (user_id, f"%{first}%", f"%{first}%",
+                                            f"%{second}%", f"%{second}%")).fetchall()
+
+        def fts_search(user_id, first, second):
+            search_chat_history(connection, user_id, f"{first} {second}")
+
+        report("LIKE", time_queries(like_search, queries))
+        report("FTS5", time_queries(fts_search, queries))
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="number of chat_history rows")
+    parser.add_argument("--users", type=int, default=1000, help="number of distinct users")
+    parser.add_argument("--queries", type=int, default=200, help="number of timed queries per method")
+    args = parser.parse_args()
+
+    main(args.rows, args.users, args.queries)
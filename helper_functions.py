@@ -7,19 +7,23 @@ import requests
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import uuid
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv  # To load the environment variables from .env
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain.vectorstores import FAISS
-from pytubefix import YouTube
+from youtube_ingest import fetch_captions
 from pathlib import Path
 from llama_parse import LlamaParse
 import nest_asyncio
 import langchain
 from langchain_groq import ChatGroq
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
+from sharded_store import TenantIndex, add_tenant_documents, delete_tenant_documents, get_shard, shard_for_user
+from embedding_batcher import EmbeddingBatcher
+from index_vacuum import schedule_vacuum
+from dedup import deduplicate_chunks
 
 
 # Define the function to crawl the URL and return content
@@ -174,83 +178,126 @@ def map_chat_num_to_uuids(docs: List[Document]) -> Dict[int, List[str]]:
 load_dotenv()
 
 
-def manage_faiss_index(user_id: str, docs: List[Document], ids: List[str]) -> FAISS:
+# Shared by every request so concurrent embedding calls can be batched together
+_embeddings_model = None
+_embeddings_model_lock = threading.Lock()
+
+
+def get_embeddings_model() -> EmbeddingBatcher:
+    """
+    Returns the process-wide embeddings model used to embed documents and queries.
+
+    The Google embeddings model is wrapped in an EmbeddingBatcher, which merges the texts of
+    concurrent ingestions and queries into shared provider calls.
+
+    Returns:
+        EmbeddingBatcher: The batched embeddings model.
+    """
+    global _embeddings_model
+
+    with _embeddings_model_lock:
+        if _embeddings_model is None:
+            # Load the API key from the environment variables
+            api_key = os.getenv("GOOGLE_API_KEY")
+
+            if not api_key:
+                raise ValueError("Google API key is not set. Please check your .env file.")
+
+            _embeddings_model = EmbeddingBatcher(GoogleGenerativeAIEmbeddings(
+                model="models/embedding-001",  # Replace with the actual model name
+                api_key=api_key
+            ))
+
+    return _embeddings_model
+
+
+def manage_faiss_index(user_id: str, docs: List[Document], ids: List[str],
+                       references: Dict[str, List[dict]] = None) -> TenantIndex:
     """
-    Manages FAISS index for a given user. If an index for the user_id already exists, it loads the index and adds documents.
-    Otherwise, it creates a new index from the provided documents and saves it.
+    Adds documents to the user's FAISS index. Users are hashed into shared shards (see sharded_store),
+    the shard is created on first use. Every call adds a segment to the shard, the background
+    vacuum merges them.
 
     Args:
-        user_id (str): The user ID (used to name the FAISS index file).
+        user_id (str): The user ID owning the documents.
         docs (List[Document]): The list of LangChain documents to add to the FAISS index.
         ids (List[str]): The unique IDs corresponding to each document.
+        references (Dict[str, List[dict]], optional): The sources to record on the user's
+            existing chunks, as returned by deduplicate_user_chunks.
 
     Returns:
-        FAISS: The FAISS vector store.
+        TenantIndex: The user's view of the FAISS vector store.
     """
-    # Load the API key from the environment variables
-    api_key = os.getenv("GOOGLE_API_KEY")
+    # Initialize the embeddings model
+    embeddings_model = get_embeddings_model()
 
-    if not api_key:
-        raise ValueError("Google API key is not set. Please check your .env file.")
+    vector_db = add_tenant_documents(user_id, docs, ids, embeddings_model, references)
+    schedule_vacuum(user_id)
+    print(f"Documents added to FAISS shard {vector_db.shard_id} for user {user_id}.")
 
-    # Initialize the embeddings model
-    embeddings_model = GoogleGenerativeAIEmbeddings(
-        model="models/embedding-001",  # Replace with the actual model name
-        api_key=api_key
-    )
+    return vector_db
 
-    # Define the path where the FAISS index is saved (based on user_id)
-    index_path = f"faiss_index_{user_id}"
-
-    # Check if the FAISS index folder for the user_id exists
-    if os.path.exists(index_path):
-        # If the index already exists, load the FAISS index
-        print(f"FAISS index for user {user_id} exists. Loading index...")
-        vector_db = FAISS.load_local(
-            index_path,
-            embeddings=embeddings_model,
-            allow_dangerous_deserialization=True  # Enable deserialization
-        )
 
-        # Add new documents to the existing FAISS index
-        vector_db.add_documents(documents=docs, ids=ids)
-        vector_db.save_local(index_path)
-        print(f"Documents added to existing FAISS index for user {user_id}.")
+def deduplicate_user_chunks(user_id, docs: List[Document]) -> Tuple[List[Document], dict, Dict[str, List[dict]]]:
+    """
+    Drops chunks that near-duplicate a chunk of the same category already in the user's index,
+    or an earlier chunk of the same ingest, before they are embedded. Boilerplate repeated on
+    every page of a site (navigation, cookie banners, footers) is the typical case.
 
+    The surviving chunk records the sources of the chunks dropped in its favour, so deleting
+    its own source later hands it over to them instead of losing the content. For chunks
+    already indexed, these references are returned and only written by manage_faiss_index,
+    together with the chunks of the new source.
 
-    else:
-        # If the index doesn't exist, create a new FAISS index from documents
-        print(f"FAISS index for user {user_id} does not exist. Creating new index...")
-        vector_db = FAISS.from_documents(documents=docs, embedding=embeddings_model, ids=ids)
+    Args:
+        user_id: The user ID owning the FAISS index.
+        docs (List[Document]): The chunks produced by split_documents_into_chunks.
 
-        # Save the newly created FAISS index locally
-        vector_db.save_local(index_path)
-        print(f"FAISS index for user {user_id} created and saved.")
+    Returns:
+        Tuple[List[Document], dict, Dict[str, List[dict]]]: The chunks left to embed, the
+        chunks and estimated embedding tokens saved, and the sources to record on indexed
+        chunks keyed by docstore id.
+    """
+    shard = get_shard(shard_for_user(user_id))
+
+    # Only chunks of the same category are compared, searches are filtered by category
+    by_category = {}
+    for doc in docs:
+        by_category.setdefault(doc.metadata.get("category"), []).append(doc)
+
+    kept, references = [], {}
+    stats = {"chunks_total": 0, "chunks_dropped": 0, "tokens_saved": 0}
+    for category, category_docs in by_category.items():
+        category_kept, category_stats, category_references = deduplicate_chunks(
+            category_docs, shard.tenant_fingerprints(user_id, category)
+        )
+        kept.extend(category_kept)
+        references.update(category_references)
+        for key in stats:
+            stats[key] += category_stats[key]
 
-    return vector_db
+    print(f"Dedup for user {user_id}: dropped {stats['chunks_dropped']} of {stats['chunks_total']} chunks, "
+          f"~{stats['tokens_saved']} tokens saved.")
+    return kept, stats, references
 
 
 def get_youtube_video_details(url):
-    # Create a YouTube object
-    yt = YouTube(url)
-
-    # Access available captions
-    subtitles = yt.captions
-
-    # Check for 'en-IN' or 'e.in' captions
-    if 'en-IN' in subtitles or 'e.in' in subtitles:
-        # Fetch captions based on available language code
-        if 'en-IN' in subtitles:
-            caption = subtitles['en-IN']  # Access directly as a dictionary
-        else:
-            caption = subtitles['e.in']  # Access directly as a dictionary
-
-        # Generate the subtitle content
-        document_content = caption.generate_srt_captions()
-        title = yt.title  # Get video title
-        return document_content
-    else:
-        return None, "Please provide a YouTube video that has English auto-generated subtitles."
+    """
+    Fetches the English captions of a YouTube video in SRT format.
+
+    Caption tracks are tried in the order of ENGLISH_CAPTION_CODES (en-IN, e.in and the
+    auto-generated variants included) and the text is cached per video id.
+
+    Args:
+        url (str): The YouTube video URL.
+
+    Returns:
+        str: The caption text.
+
+    Raises:
+        NoEnglishCaptionsError: If the video has no English captions.
+    """
+    return fetch_captions(url)
 
 
 def parse_pdf(pdf_path):
@@ -289,102 +336,167 @@ def concatenate_document_text(document):
     return document_content
 
 
-def load_faiss_vector_db(user_id: int) -> FAISS:
+def delete_from_faiss_index(user_id, chat_num: int) -> int:
     """
-    Function to load a FAISS vector database for a given user_id.
-    
-    Parameters:
-    user_id (str): The user ID for which to load the FAISS index.
-    
+    Removes every chunk of a source (identified by its chat_num) from the user's FAISS index.
+
+    The chunks, text and metadata included, are deleted straight away; only their vectors stay
+    in the shard's segment files until the shard is vacuumed. Chunks that other sources also rely on (their
+    near-duplicates were dropped at ingest) are handed over to them instead.
+
+    Args:
+        user_id: The user ID owning the FAISS index.
+        chat_num (int): The chat_num of the source whose chunks should be removed.
+
     Returns:
-    FAISS: The loaded FAISS vector store.
+        int: The number of chunks that were removed.
     """
+    return delete_tenant_documents(user_id, chat_num)
 
-    # Get the API key from environment variables
-    api_key = os.getenv("GOOGLE_API_KEY")
 
-    if api_key is None:
-        raise ValueError("GOOGLE_API_KEY not found in environment variables")
+# Prompt used to answer a question from the retrieved documents
+QA_PROMPT = PromptTemplate(
+    template="""Use the following documents to answer the question: , if there are no documents below use your own knowledge , you should reply like 
+    "there is no relevant documents saved in memory ,based on my knowledge" and your answer
+        
+        {context}
+        
+        Question: {question}
+        
+        Answer:""",
+    input_variables=["context", "question"]
+)
 
-    # Initialize the embeddings model
-    embeddings_model = GoogleGenerativeAIEmbeddings(
-        model="models/embedding-001",  # Replace with the actual model name
-        api_key=api_key  # Pass the API key dynamically
-    )
-    user_id = str(user_id)
-    # Load the vector database from local storage using user_id
-    vector_db = FAISS.load_local(
-        f"faiss_index_{user_id}",  # Use the user_id to specify the index path
-        embeddings=embeddings_model,
-        allow_dangerous_deserialization=True  # Enable deserialization
-    )
+# Shared by every request, built on first use
+_chat_model = None
+_chat_model_lock = threading.Lock()
 
-    return vector_db
+# Background warm-ups triggered by /login
+_preload_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="warm-up")
+
+# Thread pool running fan-out searches; FAISS releases the GIL while it searches
+_search_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SEARCH_WORKERS", "8")),
+    thread_name_prefix="faiss-search"
+)
 
 
-def query_retrieval_qa(query: str, category: str = None, vector_db=None):
+def get_chat_model() -> ChatGroq:
     """
-    Function to run a query through the RetrievalQA chain. 
-    If a category is provided, it applies a filter based on the category.
-    
-    Parameters:
-    query (str): The question to be answered.
-    category (str, optional): The category to filter the FAISS search. Defaults to None.
-    vector_db: The FAISS vector store that acts as the retriever.
+    Returns the process-wide ChatGroq model used to answer questions.
 
     Returns:
-    dict: The result of the query processing.
+        ChatGroq: The chat model.
     """
+    global _chat_model
 
-    # Ensure the GROQ API key is in the environment
-    api_key = os.getenv("GROQ_API_KEY")
+    with _chat_model_lock:
+        if _chat_model is None:
+            # Ensure the GROQ API key is in the environment
+            api_key = os.getenv("GROQ_API_KEY")
 
-    if api_key is None:
-        raise ValueError("GROQ_API_KEY not found in environment variables")
+            if api_key is None:
+                raise ValueError("GROQ_API_KEY not found in environment variables")
 
-    # Initialize the ChatGroq model
-    llm = ChatGroq(
-        model="llama-3.1-70b-versatile",
-        temperature=0.6,
-        max_retries=2,
-        api_key=api_key
-    )
+            _chat_model = ChatGroq(
+                model="llama-3.1-70b-versatile",
+                temperature=0.6,
+                max_retries=2,
+                api_key=api_key
+            )
 
-    # Set up the retriever from the vector DB
-    retriever = vector_db.as_retriever(
-        search_kwargs={
-            "filter": {"category": category},  # Filter to only include documents with category "asw"
-            "k": 10,  # Number of top documents to retrieve
-            "similarity": "cosine"  # Specify the similarity measure (e.g., "cosine", "euclidean")
-        }
-    )
-    # Define the custom prompt template
-    prompt_template = PromptTemplate(
-        template="""Use the following documents to answer the question: , if there are no documents below use your own knowledge , you should reply like 
-    "there is no relevant documents saved in memory ,based on my knowledge" and your answer
-        
-        {context}
-        
-        Question: {question}
-        
-        Answer:""",
-        input_variables=["context", "question"]
-    )
+    return _chat_model
 
-    # Create the RetrievalQA chain
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",  # Use "stuff", "map_reduce", etc.
-        retriever=retriever,
-        return_source_documents=True,
-        verbose=False,
-        chain_type_kwargs={"prompt": prompt_template}
-    )
 
-    # Enable debugging 
-    # langchain.debug = True
-    result = qa_chain.invoke({"query": query})
-    return result["result"]
+def _warm_user(user_id) -> None:
+    try:
+        get_embeddings_model()
+        get_chat_model()
+        # Load the segments holding the user's vectors and its position map
+        get_shard(shard_for_user(user_id)).warm_tenant(user_id)
+    except Exception as e:
+        print(f"Warming up user {user_id} failed: {e}")
+
+
+def preload_user(user_id) -> None:
+    """
+    Loads the user's FAISS segments and the embedding and chat clients in the background, so
+    the user's first query after logging in does not pay for them. Best effort: failures
+    are only logged.
+
+    Args:
+        user_id: The user ID about to query.
+    """
+    _preload_pool.submit(_warm_user, user_id)
+
+
+def fan_out_search(query: str, index_ids: List, categories: List[str] = None, k: int = 10,
+                   fetch_k: int = 40) -> List[Document]:
+    """
+    Searches several indexes and categories concurrently and merges the hits by score.
+
+    The query is embedded once; one search per distinct (index, category) pair then runs on
+    the search thread pool, so the latency stays close to that of the slowest single search.
+
+    Args:
+        query (str): The question to search for.
+        index_ids (List): The user IDs of the indexes to search.
+        categories (List[str], optional): Categories to search, None searches every category.
+        k (int, optional): Number of documents to return after merging.
+        fetch_k (int, optional): Candidates fetched per search before filtering.
+
+    Returns:
+        List[Document]: The k closest documents across every search.
+    """
+    embeddings_model = get_embeddings_model()
+    embedding = embeddings_model.embed_query(query)
+
+    # Repeated ids or categories would run the same search twice
+    index_ids = list(dict.fromkeys(str(index_id) for index_id in index_ids))
+    categories = list(dict.fromkeys(categories or [None]))
+
+    futures = [
+        _search_pool.submit(
+            TenantIndex(index_id, embeddings_model).similarity_search_with_score_by_vector,
+            embedding,
+            k=k,
+            filter={"category": category} if category else None,
+            fetch_k=fetch_k
+        )
+        for index_id in index_ids
+        for category in categories
+    ]
+
+    # Every index shares the embedding model, so the L2 distances are comparable
+    results = [hit for future in futures for hit in future.result()]
+    results.sort(key=lambda hit: hit[1])
+
+    # Searches can overlap (an empty category matches every category), keep each chunk once
+    docs, seen = [], set()
+    for doc, _ in results:
+        key = (doc.metadata.get("chat_num"), doc.page_content)
+        if key not in seen:
+            seen.add(key)
+            docs.append(doc)
+
+    return docs[:k]
+
+
+def answer_from_documents(query: str, docs: List[Document]) -> str:
+    """
+    Answers a question with the LLM, stuffing the given documents into the prompt.
+
+    Args:
+        query (str): The question to be answered.
+        docs (List[Document]): The documents retrieved for the question.
+
+    Returns:
+        str: The LLM's answer.
+    """
+    llm = get_chat_model()
+    context = "\n\n".join(doc.page_content for doc in docs)
+
+    return (QA_PROMPT | llm).invoke({"context": context, "question": query}).content
 
 
 def getTitle(url):
@@ -400,4 +512,4 @@ def getTitle(url):
         title = soup.title.string if soup.title else "No title found"
         return title
     else:
-        return (f"Failed to retrieve the URL: {response.status_code}")
\ No newline at end of file
+        return (f"Failed to retrieve the URL: {response.status_code}")
\ No newline at end of file
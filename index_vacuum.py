@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+
+from sharded_store import existing_shards, get_shard, shard_for_user, vacuum_shard
+
+# Rewrite a segment once more than this share of its vectors belongs to deleted chunks
+VACUUM_THRESHOLD = float(os.getenv("VACUUM_THRESHOLD", "0.2"))
+
+# Seconds between two vacuum passes
+VACUUM_INTERVAL = float(os.getenv("VACUUM_INTERVAL", "60"))
+
+# Shards that received ingests or deletions and still hold vectors a compaction may remove or merge
+_pending_shards = set()
+_pending_lock = threading.Lock()
+_worker = None
+
+
+def schedule_vacuum(user_id) -> None:
+    """
+    Marks the shard holding the user's vectors as a candidate for the next vacuum pass.
+
+    Args:
+        user_id: The user ID whose chunks were added or deleted.
+    """
+    with _pending_lock:
+        _pending_shards.add(shard_for_user(user_id))
+
+
+def run_vacuum_pass(threshold: float = VACUUM_THRESHOLD) -> int:
+    """
+    Vacuums every pending shard, see sharded_store.vacuum_shard. Shards still holding deleted
+    vectors below the threshold, or ingest segments, stay pending for the next pass.
+
+    Args:
+        threshold (float, optional): The deleted share above which a segment is rewritten.
+
+    Returns:
+        int: The total number of vectors removed.
+    """
+    with _pending_lock:
+        shard_ids = list(_pending_shards)
+        _pending_shards.clear()
+
+    removed = 0
+    for shard_id in shard_ids:
+        try:
+            removed += vacuum_shard(shard_id, threshold)
+            pending = get_shard(shard_id).needs_vacuum()
+        except Exception as e:
+            print(f"Vacuum of FAISS shard {shard_id} failed: {e}")
+            pending = True
+
+        if pending:
+            with _pending_lock:
+                _pending_shards.add(shard_id)
+
+    return removed
+
+
+def _vacuum_loop() -> None:
+    while True:
+        time.sleep(VACUUM_INTERVAL)
+        run_vacuum_pass()
+
+
+def start_vacuum_worker() -> None:
+    """
+    Starts the background thread that periodically vacuums pending shards (idempotent). Every
+    shard on disk starts pending, the set is not persisted across restarts.
+    """
+    global _worker
+
+    with _pending_lock:
+        if _worker is None:
+            _pending_shards.update(existing_shards())
+            _worker = threading.Thread(target=_vacuum_loop, name="faiss-vacuum", daemon=True)
+            _worker.start()
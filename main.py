@@ -13,13 +13,23 @@ from helper_functions import (
     map_chat_num_to_uuids,
     manage_faiss_index, get_youtube_video_details,
     parse_pdf,
-    concatenate_document_text, load_faiss_vector_db, query_retrieval_qa,
-    getTitle
+    concatenate_document_text, fan_out_search, answer_from_documents,
+    getTitle, delete_from_faiss_index, preload_user, deduplicate_user_chunks
+)
+from index_vacuum import schedule_vacuum, start_vacuum_worker
+from admission import AdmissionRejected, llm_admission, response_flights
+from youtube_ingest import (
+    NO_ENGLISH_CAPTIONS, YOUTUBE_MAX_PLAYLIST_VIDEOS, NoEnglishCaptionsError,
+    fetch_captions_bulk, resolve_video_urls
 )
 from model import db
+from sharded_store import warm_segments
+from chat_search import empty_results, ensure_chat_history_fts, search_chat_history
+from profiling import init_profiling
 
 app = Flask(__name__)
 CORS(app)
+init_profiling(app)
 UPLOAD_FOLDER = 'uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.sqlite3'
@@ -28,6 +38,50 @@ app.app_context().push()
 
 DATABASE = './instance/database.sqlite3'
 
+# Index ids (e.g. team memories) every user may search alongside their own index
+SHARED_INDEX_IDS = {index_id.strip() for index_id in os.getenv("SHARED_INDEX_IDS", "").split(",") if index_id.strip()}
+
+# Whether the chat history full-text index is known to exist
+chat_history_fts_ready = False
+
+
+def migrate_database():
+    """
+    Brings an existing SQLite database up to date with columns added after it was created.
+    """
+    global chat_history_fts_ready
+
+    if not os.path.exists(DATABASE):
+        return
+
+    connection = sqlite3.connect(DATABASE)
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA table_info(memories)")
+    columns = [row[1] for row in cursor.fetchall()]
+
+    if columns and "chat_num" not in columns:
+        cursor.execute("ALTER TABLE memories ADD COLUMN chat_num VARCHAR(255)")
+
+        # Backfill from the URL, which is what the chat_num has always been derived from
+        cursor.execute("SELECT id, url FROM memories")
+        for memory_id, url in cursor.fetchall():
+            cursor.execute(
+                "UPDATE memories SET chat_num = ? WHERE id = ?",
+                (str(generate_number_from_input(url)), memory_id)
+            )
+        connection.commit()
+
+    # Full-text index over the chat history, kept in sync by triggers
+    chat_history_fts_ready = ensure_chat_history_fts(connection)
+
+    cursor.close()
+    connection.close()
+
+
+migrate_database()
+start_vacuum_worker()
+warm_segments.start_sweeper()
+
 
 @app.route('/update_url_vdb', methods=['POST'])
 def update_url_vdb():
@@ -39,15 +93,16 @@ def update_url_vdb():
     category = data.get("category")
     
     title = getTitle(url)
+    chat_num = generate_number_from_input(url)
     
     connection = sqlite3.connect(DATABASE)
     if connection:
         cursor = connection.cursor()
         insert_query = """
-            INSERT INTO memories (url, category, user_id, title)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO memories (url, category, user_id, title, chat_num)
+            VALUES (?, ?, ?, ?, ?)
         """
-        cursor.execute(insert_query, (url, category, user_id, title))
+        cursor.execute(insert_query, (url, category, user_id, title, str(chat_num)))
         connection.commit()
         cursor.close()
         connection.close()
@@ -70,12 +125,14 @@ def update_url_vdb():
     # Step 4: Split documents into chunks
     docs = split_documents_into_chunks(document)
 
-    # Step 5: Map chat_num to UUIDs
-    ids = map_chat_num_to_uuids(docs)[0]
-    chat_num_uuid_mapping = map_chat_num_to_uuids(docs)[1]
+    # Step 5: Drop chunks that near-duplicate ones already in the user's index (nav bars, footers...)
+    docs, dedup_stats, references = deduplicate_user_chunks(user_id, docs)
 
-    # Step 6: Manage the FAISS index for the given user_id
-    vector_db = manage_faiss_index(user_id, docs, ids)
+    # Step 6: Map chat_num to UUIDs
+    ids, chat_num_uuid_mapping = map_chat_num_to_uuids(docs)
+
+    # Step 7: Manage the FAISS index for the given user_id
+    vector_db = manage_faiss_index(user_id, docs, ids, references)
 
     # Return a successful response
     return jsonify({
@@ -83,6 +140,7 @@ def update_url_vdb():
         "user_id": user_id,
         "url": url,
         "category": category,
+        "dedup": dedup_stats,
         "uuid_mapping": chat_num_uuid_mapping
     }), 200
 
@@ -103,10 +161,10 @@ def update_yt_url_vdb():
             return jsonify({"error": "url, user_id, and category are required fields."}), 400
 
         # Fetch YouTube video details
-        document_content = get_youtube_video_details(url)
-
-        if document_content.startswith("Please provide"):
-            return jsonify({"error": document_content}), 400
+        try:
+            document_content = get_youtube_video_details(url)
+        except NoEnglishCaptionsError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Generate unique number based on input
         unique_number = generate_number_from_input(url)
@@ -117,11 +175,72 @@ def update_yt_url_vdb():
         # Split the document into chunks
         docs = split_documents_into_chunks(document)
 
+        # Drop chunks that near-duplicate ones already in the user's index
+        docs, dedup_stats, references = deduplicate_user_chunks(user_id, docs)
+
         # Map documents to UUIDs
         ids, chat_num_uuid_mapping = map_chat_num_to_uuids(docs)
 
         # Manage FAISS vector index
-        vector_db = manage_faiss_index(user_id, docs, ids)
+        vector_db = manage_faiss_index(user_id, docs, ids, references)
+
+        # Return the success response
+        return jsonify({
+            "message": "FAISS vector database updated successfully.",
+            "user_id": user_id,
+            "url": url,
+            "category": category,
+            "dedup": dedup_stats,
+            "uuid_mapping": chat_num_uuid_mapping
+        }), 200
+
+    except Exception as e:
+        # Handle any exceptions and return an error message
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/update_yt_playlist_vdb', methods=['POST'])
+def update_yt_playlist_vdb():
+    try:
+        # Get data from request body
+        data = request.get_json()
+        url = data.get('url')
+        user_id = data.get('user_id')
+        category = data.get('category')
+        max_videos = data.get('max_videos', YOUTUBE_MAX_PLAYLIST_VIDEOS)
+
+        if not url or not user_id or not category:
+            return jsonify({"error": "url, user_id, and category are required fields."}), 400
+
+        if isinstance(max_videos, str) and max_videos.strip().isdigit():
+            max_videos = int(max_videos)
+        if isinstance(max_videos, bool) or not isinstance(max_videos, int) or max_videos < 1:
+            return jsonify({"error": "max_videos must be a positive integer."}), 400
+
+        # Resolve the playlist or channel into its videos
+        video_urls = resolve_video_urls(url, min(max_videos, YOUTUBE_MAX_PLAYLIST_VIDEOS))
+
+        # Fetch the captions concurrently, cached videos skip the network
+        captions, skipped = fetch_captions_bulk(video_urls)
+
+        if not captions:
+            return jsonify({"error": NO_ENGLISH_CAPTIONS, "skipped": skipped}), 400
+
+        # Convert every video to chunks, each video keeps its own chat_num
+        docs = []
+        for video_url, document_content in captions.items():
+            unique_number = generate_number_from_input(video_url)
+            document = convert_to_langchain_document(document_content, video_url, category, unique_number)
+            docs.extend(split_documents_into_chunks(document))
+
+        # Drop chunks that near-duplicate ones already in the user's index or in another video
+        docs, dedup_stats, references = deduplicate_user_chunks(user_id, docs)
+
+        # Map documents to UUIDs
+        ids, chat_num_uuid_mapping = map_chat_num_to_uuids(docs)
+
+        # Embed and store every video in a single pass
+        vector_db = manage_faiss_index(user_id, docs, ids, references)
 
         # Return the success response
         return jsonify({
@@ -129,6 +248,9 @@ def update_yt_url_vdb():
             "user_id": user_id,
             "url": url,
             "category": category,
+            "videos_ingested": len(captions),
+            "skipped": skipped,
+            "dedup": dedup_stats,
             "uuid_mapping": chat_num_uuid_mapping
         }), 200
 
@@ -179,11 +301,14 @@ def update_pdf_vdb():
     # Split the document into chunks
     docs = split_documents_into_chunks(doc)
 
+    # Drop chunks that near-duplicate ones already in the user's index
+    docs, dedup_stats, references = deduplicate_user_chunks(user_id, docs)
+
     # Map documents to UUIDs
     ids, chat_num_uuid_mapping = map_chat_num_to_uuids(docs)
 
     # Manage FAISS vector index
-    vector_db = manage_faiss_index(str(user_id), docs, ids)
+    vector_db = manage_faiss_index(str(user_id), docs, ids, references)
 
     # Return the success response
     return jsonify({
@@ -191,6 +316,7 @@ def update_pdf_vdb():
         "user_id": user_id,
         "source": pdf_name,
         "category": category,
+        "dedup": dedup_stats,
         "uuid_mapping": chat_num_uuid_mapping
     }), 200
 
@@ -203,6 +329,7 @@ def update_pdf_vdb():
 def get_response():
     """
     Flask route to process a query with a FAISS retriever based on user_id and category.
+    A list of categories and/or index ids can be given to search several of them at once.
     """
     try:
         # Get parameters from the request
@@ -210,19 +337,82 @@ def get_response():
         user_id = data.get('user_id')
         query = data.get('query')
         category = data.get('category', None)  # Optional, default to None
-        print(category)
+        categories = data.get('categories') or ([category] if category else None)  # Optional list
+        index_ids = data.get('index_ids') or [user_id]  # Optional list, defaults to the user's own index
         if not user_id or not query:
             return jsonify({"error": "user_id and query are required fields"}), 400
 
-        # Load FAISS vector database for the given user_id
-        vect_db = load_faiss_vector_db(user_id)
+        if not isinstance(index_ids, list) or (categories is not None and not isinstance(categories, list)):
+            return jsonify({"error": "categories and index_ids must be lists"}), 400
+        if categories is not None and not all(isinstance(category, str) for category in categories):
+            return jsonify({"error": "categories must be a list of strings"}), 400
 
-        # Run the query retrieval
-        output = query_retrieval_qa(query, category, vect_db)
+        # Only the user's own index and the shared ones may be searched
+        forbidden = [index_id for index_id in index_ids
+                     if str(index_id) != str(user_id) and str(index_id) not in SHARED_INDEX_IDS]
+        if forbidden:
+            return jsonify({"error": f"Access to index ids {forbidden} is not allowed"}), 403
+
+        def answer():
+            # Take a slot before any work, so a rejected request costs no embedding or search
+            with llm_admission.admit():
+                # Search every (index, category) pair in parallel and merge the hits by score
+                docs = fan_out_search(query, index_ids, categories)
+
+                # Run the LLM step once on the merged documents
+                return answer_from_documents(query, docs)
+
+        # Identical queries already in flight share one answer instead of each calling the LLM
+        key = (str(user_id), tuple(categories or ()), tuple(map(str, index_ids)), query)
+        output = response_flights.do(key, answer)
 
         # Return the output as JSON
         return jsonify(output), 200
 
+    except AdmissionRejected as e:
+        return jsonify({"error": str(e)}), e.status_code, {"Retry-After": str(e.retry_after)}
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/delete_memory', methods=['POST'])
+def delete_memory():
+    """
+    Flask route to remove a source's chunks from the user's FAISS index and memories.
+    """
+    try:
+        data = request.get_json()
+        user_id = data.get('user_id')
+        chat_num = data.get('chat_num')
+
+        if not user_id or not chat_num:
+            return jsonify({"error": "user_id and chat_num are required fields"}), 400
+
+        # Delete the chunks, the background vacuum drops their vectors from the shard later
+        deleted_chunks = delete_from_faiss_index(user_id, chat_num)
+        if deleted_chunks:
+            schedule_vacuum(user_id)
+
+        connection = sqlite3.connect(DATABASE)
+        cursor = connection.cursor()
+        delete_query = "DELETE FROM memories WHERE user_id = ? AND chat_num = ?"
+        cursor.execute(delete_query, (user_id, str(chat_num)))
+        deleted_memories = cursor.rowcount
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+        if not deleted_chunks and not deleted_memories:
+            return jsonify({"error": "No memory found for the given chat_num"}), 404
+
+        return jsonify({
+            "message": "Memory deleted successfully.",
+            "user_id": user_id,
+            "chat_num": chat_num,
+            "deleted_chunks": deleted_chunks
+        }), 200
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -272,6 +462,40 @@ def get_current_chat():
         return jsonify({"error": "Failed to connect to the database"}), 500
 
 
+@app.route("/search_chat")
+def search_chat():
+    global chat_history_fts_ready
+
+    user_id = request.args.get("userid")
+    query = request.args.get("q")
+    if not user_id or not query:
+        return jsonify({"error": "userid and q are required"}), 400
+
+    try:
+        user_id = int(user_id)
+        page = int(request.args.get("page", 1))
+        page_size = int(request.args.get("page_size", 20))
+    except ValueError:
+        return jsonify({"error": "userid, page and page_size must be integers"}), 400
+
+    connection = sqlite3.connect(DATABASE)
+    if connection:
+        try:
+            # The index is created at startup, unless chat_history did not exist yet then
+            if not chat_history_fts_ready:
+                chat_history_fts_ready = ensure_chat_history_fts(connection)
+            if chat_history_fts_ready:
+                res = search_chat_history(connection, user_id, query, page, page_size)
+            else:
+                # No chat history has been stored yet
+                res = empty_results(page, page_size)
+        finally:
+            connection.close()
+        return jsonify(res)
+    else:
+        return jsonify({"error": "Failed to connect to the database"}), 500
+
+
 # @app.route("/voice", methods=["POST"])
 # def text_to_voice():
     data = request.json['inputText']
@@ -393,6 +617,8 @@ def login():
             user = cursor.fetchone()
 
             if user and check_password_hash(user[1], password):
+                # The user is about to query, warm up their index in the background
+                preload_user(user[0])
                 return jsonify({"message": "Login successful", "user_id": user[0]}), 200
             else:
                 return jsonify({"error": "Invalid email or password"}), 401
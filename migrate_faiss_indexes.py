@@ -0,0 +1,97 @@
+"""
+Imports the legacy per-user `faiss_index_{user_id}` directories into the sharded vector store.
+
+Vectors are copied as they are, so nothing is re-embedded, and each chunk gets the SimHash
+fingerprint dedup compares new chunks against. Vectors already present in the user's shard
+are skipped, which makes the migration safe to re-run.
+
+Each user is imported by one write to its shard (see sharded_store.Shard), which the server
+picks up on the user's next search, so the migration can run while the server is up.
+
+Usage:
+    python migrate_faiss_indexes.py [--source-dir .] [--remove]
+"""
+import argparse
+import os
+import re
+import shutil
+
+from langchain.vectorstores import FAISS
+
+from dedup import simhash
+from sharded_store import get_shard, shard_for_user
+
+LEGACY_INDEX_PATTERN = re.compile(r"^faiss_index_(.+)$")
+
+
+def migrate_user_index(user_id: str, index_path: str) -> int:
+    """
+    Copies one legacy per-user FAISS index into the user's shard.
+
+    Args:
+        user_id (str): The user owning the legacy index.
+        index_path (str): The legacy index directory.
+
+    Returns:
+        int: The number of vectors imported (vectors imported by an earlier run are skipped).
+    """
+    legacy_db = FAISS.load_local(
+        index_path,
+        embeddings=None,  # Vectors are copied, nothing gets embedded
+        allow_dangerous_deserialization=True  # Enable deserialization
+    )
+    vectors = legacy_db.index.reconstruct_n(0, legacy_db.index.ntotal)
+
+    texts, embeddings, metadatas, ids = [], [], [], []
+    for position, doc_id in sorted(legacy_db.index_to_docstore_id.items()):
+        doc = legacy_db.docstore.search(doc_id)
+        if doc.metadata.get("deleted"):
+            # Chunks tombstoned in the legacy index are not worth carrying over
+            continue
+        texts.append(doc.page_content)
+        embeddings.append(vectors[position].tolist())
+        metadata = {key: value for key, value in doc.metadata.items() if key != "deleted"}
+        metadata.setdefault("simhash", simhash(doc.page_content))
+        metadatas.append(metadata)
+        ids.append(doc_id)
+
+    shard = get_shard(shard_for_user(user_id))
+
+    # Skip vectors imported by an earlier run
+    known = shard.tenant_ids(user_id)
+    rows = [row for row in zip(texts, embeddings, metadatas, ids) if row[3] not in known]
+    if not rows:
+        return 0
+    shard.add_embeddings(user_id, *map(list, zip(*rows)))
+    return len(rows)
+
+
+def migrate_all(source_dir: str = ".", remove: bool = False) -> None:
+    """
+    Migrates every legacy `faiss_index_*` directory found in source_dir.
+
+    Args:
+        source_dir (str, optional): Directory holding the legacy indexes.
+        remove (bool, optional): Delete each legacy directory once it has been imported.
+    """
+    for name in sorted(os.listdir(source_dir)):
+        match = LEGACY_INDEX_PATTERN.match(name)
+        index_path = os.path.join(source_dir, name)
+        if not match or not os.path.isdir(index_path):
+            continue
+
+        user_id = match.group(1)
+        imported = migrate_user_index(user_id, index_path)
+        print(f"User {user_id}: imported {imported} vectors into shard {shard_for_user(user_id)}.")
+
+        if remove:
+            shutil.rmtree(index_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source-dir", default=".", help="directory holding the faiss_index_* folders")
+    parser.add_argument("--remove", action="store_true", help="delete legacy folders after importing them")
+    args = parser.parse_args()
+
+    migrate_all(args.source_dir, args.remove)
@@ -50,5 +50,5 @@ class Memories(db.Model):
     category = Column(String(255), nullable=False)
     title = Column(String(255), nullable=False)
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)  # Foreign key referencing users
-    # chat_num = Column(String(255), nullable=True)
+    chat_num = Column(String(255), nullable=True)  # Links the memory to its chunks in the FAISS index
     # uuids = Column(String, nullable=True)  # uuids field to store UUIDs (as text)
\ No newline at end of file
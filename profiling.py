@@ -0,0 +1,191 @@
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, jsonify, request, send_from_directory
+
+# Shared secret enabling profiling; when unset no hook is registered at all
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+
+# Share of requests to the profiled routes that get profiled without asking
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+# Routes that can be profiled
+PROFILE_ROUTES = set(os.getenv("PROFILE_ROUTES", "/response,/update_pdf_vdb").split(","))
+
+# Seconds between two stack samples
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+
+# Name prefixes of the worker pools a request hands work to (embedding batches, FAISS searches,
+# caption downloads), sampled along with the request thread
+PROFILE_WORKER_THREADS = tuple(os.getenv("PROFILE_WORKER_THREADS", "embed-batch,faiss-search,yt-captions").split(","))
+
+# Directory holding the collapsed-stack dumps, and how many of them are kept
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+# Request header asking for a profile (its value must be the token), and the response
+# header telling which profile was recorded
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+PROFILE_FILE_PATTERN = re.compile(r"^[\w.-]+\.collapsed$")
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """
+    Samples the call stack of one thread at a fixed interval from a background thread.
+
+    The request thread mostly waits on futures while the work runs on the worker pools, so the
+    busy threads of the pools named in `worker_prefixes` are sampled too, each stack rooted at
+    its pool name. Pools are shared: their samples also cover other requests in flight.
+
+    The profiled threads do no extra work; the result is a count per distinct stack, the
+    "collapsed stack" format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL,
+                 worker_prefixes: tuple = PROFILE_WORKER_THREADS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.worker_prefixes = worker_prefixes
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._sampler.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stopped.set()
+        self._sampler.join()
+        return self.stacks
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+
+            frame = frames.get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+            for thread in threading.enumerate():
+                frame = frames.get(thread.ident)
+                # A pool thread waiting for work sits in ThreadPoolExecutor's _worker loop
+                if frame is None or frame.f_code.co_name == "_worker" or \
+                        not thread.name.startswith(self.worker_prefixes):
+                    continue
+                self.stacks[f"{thread.name.rsplit('_', 1)[0]};{_collapse(frame)}"] += 1
+
+
+def write_profile(endpoint: str, stacks: Counter) -> str:
+    """
+    Stores a collapsed-stack profile and prunes the oldest ones beyond PROFILE_MAX_FILES.
+
+    Returns:
+        str: The file name of the stored profile, which is also its id.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}_{endpoint.strip('/').replace('/', '-')}_{uuid.uuid4().hex[:8]}.collapsed"
+
+    with open(os.path.join(PROFILE_DIR, profile_id), "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    for name in _stored_profiles()[:-PROFILE_MAX_FILES]:
+        os.remove(os.path.join(PROFILE_DIR, name))
+
+    return profile_id
+
+
+def _stored_profiles() -> list:
+    # Oldest first; file names only carry the time to the second
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = [name for name in os.listdir(PROFILE_DIR) if PROFILE_FILE_PATTERN.match(name)]
+    return sorted(profiles, key=lambda name: (os.path.getmtime(os.path.join(PROFILE_DIR, name)), name))
+
+
+def _authorized(token) -> bool:
+    # Compared as bytes: compare_digest rejects str arguments holding non-ASCII characters
+    return token is not None and hmac.compare_digest(token.encode("utf-8"), PROFILING_TOKEN.encode("utf-8"))
+
+
+def _start_profiling():
+    if request.path not in PROFILE_ROUTES:
+        return
+
+    asked = _authorized(request.headers.get(PROFILE_HEADER))
+    if asked or random.random() < PROFILE_SAMPLE_RATE:
+        g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+
+def _stop_profiling():
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return None
+
+    return write_profile(request.path, profiler.stop())
+
+
+def _after_request(response):
+    profile_id = _stop_profiling()
+    if profile_id:
+        response.headers[PROFILE_ID_HEADER] = profile_id
+    return response
+
+
+def _teardown_request(exc):
+    # Only does something when the request failed before after_request ran
+    _stop_profiling()
+
+
+def list_profiles():
+    if not _authorized(request.headers.get(PROFILE_HEADER)):
+        return jsonify({"error": "Not authorized"}), 403
+
+    return jsonify(_stored_profiles()[::-1])
+
+
+def download_profile(profile_id):
+    if not _authorized(request.headers.get(PROFILE_HEADER)):
+        return jsonify({"error": "Not authorized"}), 403
+
+    if not PROFILE_FILE_PATTERN.match(profile_id):
+        return jsonify({"error": "Invalid profile id"}), 400
+
+    return send_from_directory(os.path.abspath(PROFILE_DIR), profile_id, mimetype="text/plain")
+
+
+def init_profiling(app) -> None:
+    """
+    Registers the profiling hooks and download routes, only if PROFILING_TOKEN is set.
+
+    A request to one of PROFILE_ROUTES is profiled when it carries the token in the X-Profile
+    header, or at random with probability PROFILE_SAMPLE_RATE. The profile id comes back in
+    the X-Profile-Id header and the dump can be fetched from /profiles/<id> with the token.
+    """
+    if not PROFILING_TOKEN:
+        return
+
+    app.before_request(_start_profiling)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/profiles", "list_profiles", list_profiles)
+    app.add_url_rule("/profiles/<profile_id>", "download_profile", download_profile)
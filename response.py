@@ -1,10 +1,10 @@
 
 user_id = 1000
-from helper_functions import load_faiss_vector_db,query_retrieval_qa
+from helper_functions import fan_out_search,answer_from_documents
 
-vect_db = load_faiss_vector_db(user_id)
 query = "give me the certifications of sriram vasudeven?"
 category = "LINKEDIN"  # Optional; if no category, pass None
 # category = None 
-output = query_retrieval_qa(query,category,vect_db)
+docs = fan_out_search(query,[user_id],[category] if category else None)
+output = answer_from_documents(query,docs)
 print(output)
\ No newline at end of file
@@ -0,0 +1,673 @@
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing, contextmanager
+from typing import Dict, Iterator, List, Optional, Set
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+
+from dedup import DUPLICATE_SOURCES, add_duplicate_sources, simhash
+from warm_set import WARM_SET_BUDGET, WARM_SET_IDLE_TTL, WarmSet
+
+# Number of shards users are hashed into; changing it requires re-running the migration
+NUM_SHARDS = int(os.getenv("FAISS_NUM_SHARDS", "64"))
+
+# Directory holding one sub-directory per shard
+SHARD_ROOT = os.getenv("FAISS_SHARD_ROOT", "faiss_shards")
+
+# SQLite database inside a shard directory: the chunks (owner, text, metadata, vector position)
+# and the segment files they point into
+SHARD_DB = "shard.sqlite3"
+
+# A tenant with at least this many vectors gets a segment of its own when its shard is compacted,
+# smaller tenants are packed together
+TENANT_SEGMENT_VECTORS = int(os.getenv("FAISS_TENANT_SEGMENT_VECTORS", "5000"))
+
+# Most vectors a segment packing small tenants together holds
+PACKED_SEGMENT_VECTORS = int(os.getenv("FAISS_PACKED_SEGMENT_VECTORS", "20000"))
+
+# Ingest segments a shard accumulates before compaction merges them
+MAX_INGEST_SEGMENTS = int(os.getenv("FAISS_MAX_INGEST_SEGMENTS", "16"))
+
+# Seconds after which a segment file no chunk points into is removed. Younger files may belong
+# to an ingest that has not committed yet.
+ORPHAN_SEGMENT_GRACE = 3600
+
+# Estimated bytes per vector of a tenant's cached positions, doc ids and FAISS selector
+POSITION_MAP_BYTES = 80
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    name TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    doc_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    page_content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_by_user ON chunks (user_id, segment, position);
+CREATE INDEX IF NOT EXISTS chunks_by_segment ON chunks (segment);
+CREATE TABLE IF NOT EXISTS tenants (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+# Locks making concurrent searches load a segment file once
+_load_locks = {}
+_load_locks_guard = threading.Lock()
+
+
+def shard_for_user(user_id) -> int:
+    """
+    Maps a user ID to its shard with a stable hash.
+
+    Args:
+        user_id: The user ID.
+
+    Returns:
+        int: The shard number, between 0 and NUM_SHARDS - 1.
+    """
+    digest = hashlib.sha256(str(user_id).encode('utf-8')).hexdigest()
+    return int(digest, 16) % NUM_SHARDS
+
+
+def shard_path(shard_id: int) -> str:
+    """
+    Returns the directory of the given shard.
+    """
+    return os.path.join(SHARD_ROOT, f"shard_{shard_id:03d}")
+
+
+def load_lock(shard_id: int) -> threading.Lock:
+    """
+    Returns the lock serializing segment loads of the given shard.
+    """
+    with _load_locks_guard:
+        return _load_locks.setdefault(shard_id, threading.Lock())
+
+
+# Segment indexes kept in memory. Segment files are never modified (a compaction writes new
+# ones), so a warm segment cannot go stale: it only ages out or gets evicted by the budget.
+warm_segments = WarmSet(WARM_SET_BUDGET, WARM_SET_IDLE_TTL, size_of=lambda index: index.ntotal * index.d * 4)
+
+# Tenants' position maps (see Shard.tenant_segments), keyed by the tenant's version. They get a
+# budget of their own so that they never evict the segments they point into.
+warm_tenants = WarmSet(
+    WARM_SET_BUDGET // 8,
+    WARM_SET_IDLE_TTL,
+    size_of=lambda segments: sum(len(positions) for _, positions, _, _ in segments) * POSITION_MAP_BYTES
+)
+
+
+def _matches(metadata: dict, filter) -> bool:
+    # Same semantics as the FAISS vector store filters: a callable, or a dict of required values
+    if callable(filter):
+        return filter(metadata)
+    return all(
+        metadata.get(key) in value if isinstance(value, list) else metadata.get(key) == value
+        for key, value in filter.items()
+    )
+
+
+class Shard:
+    """
+    The vector store shared by every tenant hashed to one shard.
+
+    Vectors live in immutable FAISS segment files: every ingest appends one segment, and
+    compaction merges them into segments packing small tenants together or holding a single
+    large tenant. The chunks (owner, text, metadata and the segment position of their vector)
+    live in the shard's SQLite database, so a write is published by one transaction and the
+    shard on disk is always consistent. SQLite also serializes writes from several processes,
+    e.g. the app and the migration, and each tenant's version lets every process notice
+    writes it did not make on its next search.
+
+    A search only loads the segments holding the tenant's vectors and filters them down to
+    those vectors with a FAISS selector. Chunk texts are read from SQLite for the hits only.
+    """
+
+    def __init__(self, shard_id: int):
+        self.shard_id = shard_id
+        self.path = shard_path(shard_id)
+
+    def _connect(self, create: bool = False) -> Optional[sqlite3.Connection]:
+        # Returns None when the shard does not exist and `create` is not set
+        db_path = os.path.join(self.path, SHARD_DB)
+        if not create and not os.path.exists(db_path):
+            return None
+
+        os.makedirs(self.path, exist_ok=True)
+        connection = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        # Overwrite deleted chunks on disk instead of leaving their text in free pages
+        connection.execute("PRAGMA secure_delete=ON")
+        if create:
+            # WAL lets searches read while a write is in progress
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # Takes the shard's write lock at once, so what the transaction reads stays current
+        with closing(self._connect(create=True)) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    @staticmethod
+    def _touch(connection: sqlite3.Connection, user_ids) -> None:
+        # Called when tenants' vector positions changed, invalidates their cached position maps
+        connection.executemany(
+            "INSERT INTO tenants (user_id, version) VALUES (?, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+            [(str(user_id),) for user_id in set(user_ids)]
+        )
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self.path, name + ".faiss")
+
+    def _write_segment(self, kind: str, vectors: np.ndarray, warm: bool = True) -> str:
+        # Segment files get a new name every time, they are never overwritten
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+
+        name = f"{kind}_{uuid.uuid4().hex}"
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self._segment_path(name) + ".tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self._segment_path(name))
+        if warm:
+            warm_segments.put((self.shard_id, name), index)
+        return name
+
+    def _segment(self, name: str) -> Optional[faiss.Index]:
+        """
+        Returns a segment's index, loading it when it is not warm, or None if a compaction
+        removed it since the caller read the tenant's positions.
+        """
+        key = (self.shard_id, name)
+        index = warm_segments.get(key)
+        if index is None:
+            with load_lock(self.shard_id):
+                index = warm_segments.get(key)
+                if index is None:
+                    if not os.path.exists(self._segment_path(name)):
+                        return None
+                    index = faiss.read_index(self._segment_path(name))
+                    warm_segments.put(key, index)
+        return index
+
+    def segments(self) -> List[tuple]:
+        """
+        Returns the shard's segments as (name, kind, vectors, live vectors) tuples.
+        """
+        connection = self._connect()
+        if connection is None:
+            return []
+        with closing(connection):
+            return self._segment_stats(connection)
+
+    @staticmethod
+    def _segment_stats(connection: sqlite3.Connection) -> List[tuple]:
+        return connection.execute(
+            "SELECT s.name, s.kind, s.size, COUNT(c.doc_id) FROM segments s "
+            "LEFT JOIN chunks c ON c.segment = s.name GROUP BY s.name ORDER BY s.name"
+        ).fetchall()
+
+    def tenant_segments(self, user_id) -> List[tuple]:
+        """
+        Returns where the tenant's vectors are, as (segment, sorted positions, doc ids, FAISS
+        selector) tuples. The map is cached until the tenant's vectors change.
+        """
+        connection = self._connect()
+        if connection is None:
+            return []
+
+        user_id = str(user_id)
+        with closing(connection):
+            # One read transaction, so the version matches the positions read
+            connection.execute("BEGIN")
+            row = connection.execute("SELECT version FROM tenants WHERE user_id = ?", (user_id,)).fetchone()
+            key = (self.shard_id, user_id, row[0] if row else 0)
+            cached = warm_tenants.get(key)
+            if cached is not None:
+                return cached
+
+            rows = connection.execute(
+                "SELECT segment, position, doc_id FROM chunks WHERE user_id = ? ORDER BY segment, position",
+                (user_id,)
+            ).fetchall()
+            connection.execute("COMMIT")
+
+        tenant_segments = []
+        for segment, group in itertools.groupby(rows, key=lambda row: row[0]):
+            group = list(group)
+            positions = np.array([position for _, position, _ in group], dtype=np.int64)
+            tenant_segments.append(
+                (segment, positions, [doc_id for _, _, doc_id in group], faiss.IDSelectorBatch(positions))
+            )
+
+        warm_tenants.put(key, tenant_segments)
+        return tenant_segments
+
+    def warm_tenant(self, user_id) -> None:
+        """
+        Loads the tenant's position map and the segments holding its vectors.
+        """
+        for segment, _, _, _ in self.tenant_segments(user_id):
+            self._segment(segment)
+
+    def tenant_ids(self, user_id) -> Set[str]:
+        """
+        Returns the docstore ids of the tenant's chunks.
+        """
+        return {doc_id for _, _, doc_ids, _ in self.tenant_segments(user_id) for doc_id in doc_ids}
+
+    def tenant_fingerprints(self, user_id, category=None) -> Dict[str, int]:
+        """
+        Returns the SimHash fingerprints (see dedup) of a tenant's chunks in a category, keyed
+        by docstore id. Fingerprints missing from the metadata are computed and stored once.
+        """
+        connection = self._connect()
+        if connection is None:
+            return {}
+
+        with closing(connection):
+            rows = connection.execute(
+                "SELECT doc_id, page_content, metadata FROM chunks "
+                "WHERE user_id = ? AND json_extract(metadata, '$.category') IS ?",
+                (str(user_id), category)
+            ).fetchall()
+
+        fingerprints, missing = {}, {}
+        for doc_id, page_content, metadata in rows:
+            fingerprint = json.loads(metadata).get("simhash")
+            if fingerprint is None:
+                fingerprint = missing[doc_id] = simhash(page_content)
+            fingerprints[doc_id] = fingerprint
+
+        if missing:
+            with self._transaction() as connection:
+                for doc_id, fingerprint in missing.items():
+                    row = connection.execute("SELECT metadata FROM chunks WHERE doc_id = ?", (doc_id,)).fetchone()
+                    if row is not None:
+                        metadata = {**json.loads(row[0]), "simhash": fingerprint}
+                        connection.execute(
+                            "UPDATE chunks SET metadata = ? WHERE doc_id = ?", (json.dumps(metadata), doc_id)
+                        )
+
+        return fingerprints
+
+    def add_embeddings(self, user_id, texts: List[str], embeddings: List[List[float]],
+                       metadatas: List[dict], ids: List[str],
+                       references: Optional[Dict[str, List[dict]]] = None) -> None:
+        """
+        Adds pre-computed embeddings for a tenant to the shard, as a new segment.
+
+        `references` (see dedup.deduplicate_chunks) records on the tenant's existing chunks the
+        sources whose near-duplicates of them were dropped from this ingest. They are written
+        in the same transaction as the new chunks, so a failed ingest leaves no reference to a
+        source that was never stored.
+        """
+        if not ids and not references:
+            return
+
+        name = self._write_segment("ingest", np.array(embeddings, dtype=np.float32)) if ids else None
+        try:
+            with self._transaction() as connection:
+                if ids:
+                    connection.execute(
+                        "INSERT INTO segments (name, kind, size) VALUES (?, 'ingest', ?)", (name, len(ids))
+                    )
+                    connection.executemany(
+                        "INSERT INTO chunks (doc_id, user_id, segment, position, page_content, metadata) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        [
+                            (doc_id, str(user_id), name, position, text, json.dumps(metadata, default=str))
+                            for position, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas))
+                        ]
+                    )
+                    self._touch(connection, [user_id])
+
+                for doc_id, sources in (references or {}).items():
+                    row = connection.execute(
+                        "SELECT metadata FROM chunks WHERE doc_id = ? AND user_id = ?", (doc_id, str(user_id))
+                    ).fetchone()
+                    if row is None:
+                        continue
+
+                    metadata = json.loads(row[0])
+                    if add_duplicate_sources(metadata, sources):
+                        connection.execute(
+                            "UPDATE chunks SET metadata = ? WHERE doc_id = ?", (json.dumps(metadata), doc_id)
+                        )
+        except BaseException:
+            if name is not None:
+                os.remove(self._segment_path(name))
+            raise
+
+    def remove_source(self, user_id, chat_num) -> int:
+        """
+        Removes a source's chunks from a tenant: chunks other sources also relied on (their
+        near-duplicates were dropped) are handed over to one of them, the others are deleted.
+        Deleted chunks leave the database at once, their vectors stay in their segment until
+        it is compacted.
+
+        Returns:
+            int: The number of chunks the source lost.
+        """
+        chat_num = str(chat_num)
+        deleted, handed_over = [], 0
+
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT doc_id, metadata FROM chunks WHERE user_id = ?", (str(user_id),)
+            ).fetchall()
+
+            for doc_id, metadata in rows:
+                metadata = json.loads(metadata)
+                duplicates = metadata.get(DUPLICATE_SOURCES, [])
+                others = [source for source in duplicates if str(source["chat_num"]) != chat_num]
+
+                if str(metadata.get("chat_num")) == chat_num:
+                    if not others:
+                        deleted.append((doc_id,))
+                        continue
+                    metadata = {**metadata, **others[0], DUPLICATE_SOURCES: others[1:]}
+                    handed_over += 1
+                elif len(others) < len(duplicates):
+                    metadata = {**metadata, DUPLICATE_SOURCES: others}
+                else:
+                    continue
+                connection.execute("UPDATE chunks SET metadata = ? WHERE doc_id = ?", (json.dumps(metadata), doc_id))
+
+            if deleted:
+                connection.executemany("DELETE FROM chunks WHERE doc_id = ?", deleted)
+                self._touch(connection, [user_id])
+
+        return len(deleted) + handed_over
+
+    def needs_vacuum(self) -> bool:
+        """
+        Whether a later compaction may still have work to do: some segment holds vectors of
+        deleted chunks, or ingest segments wait to be merged.
+        """
+        return any(kind == "ingest" or live < size for _, kind, size, live in self.segments())
+
+    def _compaction_plan(self, connection: sqlite3.Connection, threshold: float) -> Set[str]:
+        """
+        Returns the segments compaction should rewrite: those whose share of deleted vectors
+        exceeds the threshold, the ingest segments once there are too many of them, and the
+        segments a tenant that outgrew the packed segments has to move out of.
+        """
+        stats = self._segment_stats(connection)
+        kinds = {name: kind for name, kind, _, _ in stats}
+        rewrite = {name for name, _, size, live in stats if size - live > threshold * size}
+
+        ingest = [name for name, kind in kinds.items() if kind == "ingest"]
+        if len(ingest) > MAX_INGEST_SEGMENTS:
+            rewrite.update(ingest)
+
+        large = connection.execute(
+            "SELECT user_id FROM chunks GROUP BY user_id HAVING COUNT(*) >= ?", (TENANT_SEGMENT_VECTORS,)
+        ).fetchall()
+        for user_id, in large:
+            segments = {
+                segment for segment, in connection.execute(
+                    "SELECT DISTINCT segment FROM chunks WHERE user_id = ?", (user_id,)
+                )
+            }
+            if any(kinds[segment] == "packed" for segment in segments):
+                rewrite.update(segment for segment in segments if kinds[segment] != "ingest")
+            if segments & rewrite:
+                # The tenant's vectors all end up in one segment of its own
+                rewrite.update(segment for segment in segments if kinds[segment] == "tenant")
+
+        return rewrite
+
+    def compact(self, threshold: float = 0.0) -> int:
+        """
+        Rewrites the segments the compaction plan selects: deleted vectors are dropped, tenants
+        with at least TENANT_SEGMENT_VECTORS vectors get a segment of their own and the smaller
+        ones are packed together. The other segments are left as they are.
+
+        Args:
+            threshold (float, optional): The share of deleted vectors above which a segment
+            is rewritten.
+
+        Returns:
+            int: The number of deleted vectors removed.
+        """
+        connection = self._connect()
+        if connection is None:
+            return 0
+        with closing(connection):
+            if not self._compaction_plan(connection, threshold):
+                return 0
+
+        with self._transaction() as connection:
+            rewrite = self._compaction_plan(connection, threshold)
+            if not rewrite:
+                return 0
+
+            placeholders = ", ".join("?" * len(rewrite))
+            old_size = connection.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM segments WHERE name IN ({placeholders})", list(rewrite)
+            ).fetchone()[0]
+            rows = connection.execute(
+                f"SELECT doc_id, user_id, segment, position FROM chunks WHERE segment IN ({placeholders}) "
+                f"ORDER BY user_id, segment, position",
+                list(rewrite)
+            ).fetchall()
+            totals = dict(connection.execute("SELECT user_id, COUNT(*) FROM chunks GROUP BY user_id"))
+
+            # Group the live vectors: one segment per large tenant, small tenants packed together
+            groups, packed = [], []
+            for user_id, user_rows in itertools.groupby(rows, key=lambda row: row[1]):
+                user_rows = list(user_rows)
+                if totals[user_id] >= TENANT_SEGMENT_VECTORS:
+                    groups.append(("tenant", user_rows))
+                    continue
+                if packed and len(packed) + len(user_rows) > PACKED_SEGMENT_VECTORS:
+                    groups.append(("packed", packed))
+                    packed = []
+                packed = packed + user_rows
+            if packed:
+                groups.append(("packed", packed))
+
+            vectors = {}
+            for segment in rewrite:
+                positions = np.array([row[3] for row in rows if row[2] == segment], dtype=np.int64)
+                if len(positions):
+                    # Read without warming, the segment is about to be replaced
+                    index = warm_segments.get((self.shard_id, segment))
+                    if index is None:
+                        index = faiss.read_index(self._segment_path(segment))
+                    vectors[segment] = dict(zip(positions.tolist(), index.reconstruct_batch(positions)))
+
+            for kind, group in groups:
+                name = self._write_segment(kind, np.array([vectors[row[2]][row[3]] for row in group]), warm=False)
+                connection.execute("INSERT INTO segments (name, kind, size) VALUES (?, ?, ?)", (name, kind, len(group)))
+                connection.executemany(
+                    "UPDATE chunks SET segment = ?, position = ? WHERE doc_id = ?",
+                    [(name, position, row[0]) for position, row in enumerate(group)]
+                )
+            connection.execute(f"DELETE FROM segments WHERE name IN ({placeholders})", list(rewrite))
+            self._touch(connection, [row[1] for row in rows])
+
+        self._remove_unused_segments(rewrite)
+        return old_size - len(rows)
+
+    def _remove_unused_segments(self, rewritten: Set[str]) -> None:
+        # Searches that read the old positions retry once they find a rewritten segment gone
+        for name in rewritten:
+            try:
+                os.remove(self._segment_path(name))
+            except FileNotFoundError:
+                pass
+
+        # Files left behind by ingests that failed before committing
+        with closing(self._connect()) as connection:
+            published = {name for name, in connection.execute("SELECT name FROM segments")}
+        for file_name in os.listdir(self.path):
+            name, extension = os.path.splitext(file_name)
+            if extension in (".faiss", ".tmp") and name.split(".")[0] not in published:
+                path = os.path.join(self.path, file_name)
+                if time.time() - os.path.getmtime(path) > ORPHAN_SEGMENT_GRACE:
+                    os.remove(path)
+
+    def _documents(self, user_id, doc_ids: List[str]) -> Dict[str, Document]:
+        connection = self._connect()
+        if connection is None or not doc_ids:
+            return {}
+        with closing(connection):
+            rows = connection.execute(
+                f"SELECT doc_id, page_content, metadata FROM chunks "
+                f"WHERE user_id = ? AND doc_id IN ({', '.join('?' * len(doc_ids))})",
+                [str(user_id), *doc_ids]
+            ).fetchall()
+        return {
+            doc_id: Document(page_content=page_content, metadata=json.loads(metadata))
+            for doc_id, page_content, metadata in rows
+        }
+
+    def _search_segments(self, user_id, vector: np.ndarray, n: int) -> Optional[List[tuple]]:
+        # Returns the n closest (distance, doc id) pairs, or None if a compaction removed one
+        # of the tenant's segments in the meantime
+        hits = []
+        for segment, positions, doc_ids, selector in self.tenant_segments(user_id):
+            index = self._segment(segment)
+            if index is None:
+                return None
+
+            scores, found = index.search(vector, min(n, len(positions)), params=faiss.SearchParameters(sel=selector))
+            for score, position in zip(scores[0], found[0]):
+                if position != -1:
+                    hits.append((float(score), doc_ids[np.searchsorted(positions, position)]))
+
+        hits.sort()
+        return hits[:n]
+
+    def search(self, user_id, embedding: List[float], k: int = 4, filter=None, fetch_k: int = 20) -> List[tuple]:
+        """
+        Runs a similarity search restricted to the tenant's vectors.
+
+        Args:
+            user_id: The tenant to search for.
+            embedding (List[float]): The query embedding.
+            k (int, optional): Number of documents to return.
+            filter (optional): Metadata filter, a dict or a callable.
+            fetch_k (int, optional): Number of candidates fetched before filtering.
+
+        Returns:
+            List[tuple]: (Document, L2 distance) pairs, closest first.
+        """
+        vector = np.array([embedding], dtype=np.float32)
+        for _ in range(3):
+            hits = self._search_segments(user_id, vector, k if filter is None else fetch_k)
+            if hits is not None:
+                break
+        else:
+            raise RuntimeError(f"Segments of FAISS shard {self.shard_id} kept disappearing during a search")
+
+        docs = self._documents(user_id, [doc_id for _, doc_id in hits])
+        results = []
+        for score, doc_id in hits:
+            # A chunk deleted since the positions were read is skipped
+            doc = docs.get(doc_id)
+            if doc is not None and (filter is None or _matches(doc.metadata, filter)):
+                results.append((doc, score))
+
+        return results[:k]
+
+
+def existing_shards() -> List[int]:
+    """
+    Returns the ids of the shards found on disk.
+    """
+    if not os.path.isdir(SHARD_ROOT):
+        return []
+    return sorted(
+        int(name[len("shard_"):]) for name in os.listdir(SHARD_ROOT)
+        if name.startswith("shard_") and name[len("shard_"):].isdigit()
+    )
+
+
+def get_shard(shard_id: int) -> Shard:
+    """
+    Returns the given shard. Shards hold no state of their own, what they load is cached in
+    warm_segments and warm_tenants.
+    """
+    return Shard(shard_id)
+
+
+class TenantIndex:
+    """
+    A single user's view of its shard. It offers the parts of the FAISS vector store API
+    the rest of the app uses, but every search only ever sees that user's vectors.
+    """
+
+    def __init__(self, user_id, embeddings_model):
+        self.user_id = str(user_id)
+        self.embeddings_model = embeddings_model
+        self.shard_id = shard_for_user(user_id)
+
+    @property
+    def shard(self) -> Shard:
+        return get_shard(self.shard_id)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, filter=None,
+                                               fetch_k: int = 20) -> List[tuple]:
+        return self.shard.search(self.user_id, embedding, k=k, filter=filter, fetch_k=fetch_k)
+
+
+def add_tenant_documents(user_id, docs: List[Document], ids: List[str], embeddings_model,
+                         references: Optional[Dict[str, List[dict]]] = None) -> TenantIndex:
+    """
+    Embeds and stores documents for a user in the user's shard, together with the dedup
+    references to record on the user's existing chunks (see Shard.add_embeddings).
+    """
+    texts = [doc.page_content for doc in docs]
+    embeddings = embeddings_model.embed_documents(texts) if texts else []
+
+    get_shard(shard_for_user(user_id)).add_embeddings(
+        user_id, texts, embeddings, [doc.metadata for doc in docs], ids, references
+    )
+    return TenantIndex(user_id, embeddings_model)
+
+
+def delete_tenant_documents(user_id, chat_num) -> int:
+    """
+    Removes every chunk of a user's source (identified by its chat_num), see Shard.remove_source.
+
+    Returns:
+        int: The number of chunks the source lost.
+    """
+    return get_shard(shard_for_user(user_id)).remove_source(user_id, chat_num)
+
+
+def vacuum_shard(shard_id: int, threshold: float = 0.0) -> int:
+    """
+    Compacts the shard's segments whose share of deleted vectors exceeds the threshold, and
+    merges its ingest segments once there are too many (see Shard.compact).
+
+    Returns:
+        int: The number of vectors removed.
+    """
+    return get_shard(shard_id).compact(threshold)
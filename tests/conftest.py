@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    """
+    Returns the main module with its database pointed at an empty file under tmp_path.
+    """
+    pytest.importorskip("crawl4ai")
+    pytest.importorskip("llama_parse")
+
+    # Importing main migrates ./instance/database.sqlite3, run it from an empty directory
+    monkeypatch.chdir(tmp_path)
+    import main
+
+    monkeypatch.setattr(main, "DATABASE", str(tmp_path / "database.sqlite3"))
+    return main
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, SingleFlight
+
+
+def test_followers_get_the_leaders_result():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("key", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+
+
+def test_followers_get_the_leaders_exception():
+    flights = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def fail():
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    def call():
+        try:
+            flights.do("key", fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ["boom"] * 3
+
+
+def test_finished_flight_is_not_reused():
+    flights = SingleFlight()
+    assert flights.do("key", lambda: 1) == 1
+    assert flights.do("key", lambda: 2) == 2
+
+
+def hold_slot(controller, entered, release):
+    with controller.admit():
+        entered.set()
+        release.wait(5)
+
+
+def test_queue_full_is_rejected_with_429():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold_slot, args=(controller, entered, release))
+    holder.start()
+    entered.wait(5)
+
+    # Takes the only queue place while waiting for the slot
+    waiter = threading.Thread(target=hold_slot, args=(controller, threading.Event(), release))
+    waiter.start()
+    time.sleep(0.1)
+
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        with controller.admit():
+            pass
+    assert time.monotonic() - start < 1
+
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after == 5
+
+    release.set()
+    holder.join()
+    waiter.join()
+
+
+def test_queue_deadline_is_rejected_with_503():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.2)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold_slot, args=(controller, entered, release))
+    holder.start()
+    entered.wait(5)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        with controller.admit():
+            pass
+
+    assert rejected.value.status_code == 503
+    assert rejected.value.retry_after == 1
+
+    release.set()
+    holder.join()
+
+
+def test_slot_is_released_when_the_block_fails():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.2)
+
+    with pytest.raises(ValueError):
+        with controller.admit():
+            raise ValueError
+
+    with controller.admit():
+        pass
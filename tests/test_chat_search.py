@@ -0,0 +1,31 @@
+import sqlite3
+
+from chat_search import ensure_chat_history_fts, search_chat_history
+
+CREATE_CHAT_HISTORY = """
+    CREATE TABLE chat_history (
+        uid INTEGER PRIMARY KEY, user_id INTEGER, chat_id INTEGER,
+        question TEXT, answer TEXT, time_stamp DATETIME
+    )
+"""
+
+
+def test_no_index_without_chat_history():
+    connection = sqlite3.connect(":memory:")
+
+    assert ensure_chat_history_fts(connection) is False
+    assert connection.execute("SELECT name FROM sqlite_master").fetchall() == []
+
+
+def test_index_created_later_covers_existing_and_new_rows():
+    connection = sqlite3.connect(":memory:")
+    connection.execute(CREATE_CHAT_HISTORY)
+    connection.execute("INSERT INTO chat_history VALUES (1, 7, 1, 'reset my password', 'Use the link', '')")
+
+    assert ensure_chat_history_fts(connection) is True
+    assert ensure_chat_history_fts(connection) is True
+    connection.execute("INSERT INTO chat_history VALUES (2, 7, 2, 'password rules', 'Twelve characters', '')")
+    connection.execute("INSERT INTO chat_history VALUES (3, 8, 3, 'password of user 8', 'Hidden', '')")
+
+    results = search_chat_history(connection, 7, "password")["results"]
+    assert sorted(result["id"] for result in results) == [1, 2]
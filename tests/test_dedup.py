@@ -0,0 +1,42 @@
+from langchain.schema import Document
+
+from dedup import DUPLICATE_SOURCES, SimHashIndex, deduplicate_chunks, simhash
+
+# A navigation and footer block of 300 distinct words, repeated on every page of a site
+BOILERPLATE = " ".join(f"link{i}" for i in range(300))
+
+
+def chunk(text, chat_num, source=None):
+    return Document(page_content=text, metadata={"chat_num": chat_num, "source": source or f"src{chat_num}"})
+
+
+def test_near_duplicates_share_a_band():
+    index = SimHashIndex({"a": simhash(BOILERPLATE)})
+
+    assert index.find_near_duplicate(simhash(BOILERPLATE + " imprint")) == "a"
+    assert index.find_near_duplicate(simhash("A completely different chunk about FAISS shards")) is None
+
+
+def test_duplicate_of_an_indexed_chunk_is_referenced():
+    kept, stats, references = deduplicate_chunks(
+        [chunk(BOILERPLATE, 2), chunk("Fresh content of the second page", 2)],
+        {"doc-1": simhash(BOILERPLATE)}
+    )
+
+    assert [doc.page_content for doc in kept] == ["Fresh content of the second page"]
+    assert stats["chunks_dropped"] == 1 and stats["tokens_saved"] == len(BOILERPLATE) // 4
+    assert references == {"doc-1": [{"chat_num": 2, "source": "src2"}]}
+    assert kept[0].metadata["simhash"] == simhash("Fresh content of the second page")
+
+
+def test_duplicate_within_the_batch_is_recorded_on_the_kept_chunk():
+    kept, stats, references = deduplicate_chunks(
+        [chunk(BOILERPLATE, 1), chunk(BOILERPLATE, 1), chunk(BOILERPLATE, 2), chunk(BOILERPLATE, 3)],
+        {}
+    )
+
+    assert len(kept) == 1 and not references
+    # The repeat from the chunk's own source is not a separate source
+    assert kept[0].metadata[DUPLICATE_SOURCES] == [
+        {"chat_num": 2, "source": "src2"}, {"chat_num": 3, "source": "src3"}
+    ]
@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+import sharded_store
+from sharded_store import get_shard
+from warm_set import WarmSet
+
+CREATE_MEMORIES = """
+    CREATE TABLE memories (
+        id INTEGER PRIMARY KEY, url VARCHAR(255), category VARCHAR(255), title VARCHAR(255),
+        user_id INTEGER, chat_num VARCHAR(255)
+    )
+"""
+
+
+@pytest.fixture
+def database(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(sharded_store, "SHARD_ROOT", str(tmp_path / "shards"))
+    monkeypatch.setattr(sharded_store, "NUM_SHARDS", 1)
+    for name in ("warm_segments", "warm_tenants"):
+        warm = getattr(sharded_store, name)
+        monkeypatch.setattr(sharded_store, name, WarmSet(1 << 30, 3600, warm.size_of))
+
+    connection = sqlite3.connect(app_module.DATABASE)
+    connection.execute(CREATE_MEMORIES)
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+def add_memory(database, user_id, url, chat_num, ids):
+    database.execute(
+        "INSERT INTO memories (url, category, user_id, title, chat_num) VALUES (?, 'notes', ?, 'title', ?)",
+        (url, user_id, chat_num)
+    )
+    database.commit()
+    get_shard(0).add_embeddings(
+        user_id,
+        [f"{url} {doc_id}" for doc_id in ids],
+        [[float(i), 0.0] for i, _ in enumerate(ids)],
+        [{"chat_num": int(chat_num), "source": url, "category": "notes"} for _ in ids],
+        ids
+    )
+
+
+def search(user_id):
+    return [doc.page_content for doc, _ in get_shard(0).search(user_id, [0.0, 0.0], k=10)]
+
+
+def test_delete_removes_the_memory_and_its_chunks(client, database):
+    add_memory(database, 1, "https://a.example", "11", ["a1", "a2"])
+    add_memory(database, 1, "https://b.example", "22", ["b1"])
+
+    response = client.post("/delete_memory", json={"user_id": 1, "chat_num": "11"})
+
+    assert response.status_code == 200 and response.get_json()["deleted_chunks"] == 2
+    assert database.execute("SELECT chat_num FROM memories").fetchall() == [("22",)]
+    assert search(1) == ["https://b.example b1"]
+
+
+def test_delete_of_an_unknown_memory_is_a_404(client, database):
+    add_memory(database, 1, "https://a.example", "11", ["a1"])
+
+    response = client.post("/delete_memory", json={"user_id": 1, "chat_num": "99"})
+
+    assert response.status_code == 404
+    assert search(1) == ["https://a.example a1"]
+
+
+def test_delete_requires_user_id_and_chat_num(client, database):
+    assert client.post("/delete_memory", json={"user_id": 1}).status_code == 400
+
+
+def test_migration_backfills_chat_num(app_module, database):
+    database.execute("DROP TABLE memories")
+    database.execute(
+        "CREATE TABLE memories (id INTEGER PRIMARY KEY, url VARCHAR(255), category VARCHAR(255), "
+        "title VARCHAR(255), user_id INTEGER)"
+    )
+    database.execute("INSERT INTO memories (url, category, title, user_id) VALUES ('https://a.example', 'notes', 't', 1)")
+    database.commit()
+
+    app_module.migrate_database()
+
+    chat_num, = database.execute("SELECT chat_num FROM memories").fetchone()
+    assert chat_num == str(app_module.generate_number_from_input("https://a.example"))
@@ -0,0 +1,140 @@
+import threading
+
+import pytest
+
+from embedding_batcher import QUERY_TASK_TYPE, EmbeddingBatcher, is_input_error
+
+
+class ProviderError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class StubProvider:
+    """
+    Embeds "<n>" as [n], and fails every call holding a text listed in `rejected`.
+    """
+
+    def __init__(self, rejected=(), error=None, drop_one=False):
+        self.rejected = set(rejected)
+        self.error = error
+        self.drop_one = drop_one
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts, task_type=None):
+        with self._lock:
+            self.calls.append((list(texts), task_type))
+        if self.error is not None:
+            raise self.error
+        if self.rejected.intersection(texts):
+            raise ProviderError("400 invalid argument", 400)
+        vectors = [[float(text)] for text in texts]
+        return vectors[:-1] if self.drop_one else vectors
+
+
+def make_batcher(provider, **kwargs):
+    options = {"max_batch_size": 100, "max_wait": 0.05, "max_retries": 2, "retry_backoff": 0}
+    options.update(kwargs)
+    return EmbeddingBatcher(provider, **options)
+
+
+def run_concurrently(batcher, groups):
+    results, errors = {}, {}
+
+    def call(index, texts):
+        try:
+            results[index] = batcher.embed_documents(texts)
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=call, args=item) for item in enumerate(groups)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+
+def test_vectors_are_routed_back_to_each_caller():
+    provider = StubProvider()
+    batcher = make_batcher(provider, max_wait=0.2)
+    groups = [[str(caller * 10 + i) for i in range(caller + 1)] for caller in range(8)]
+
+    results, errors = run_concurrently(batcher, groups)
+
+    assert not errors
+    for caller, texts in enumerate(groups):
+        assert results[caller] == [[float(text)] for text in texts]
+    # The callers shared provider calls
+    assert len(provider.calls) < len(groups)
+
+
+def test_query_uses_its_own_lane_and_task_type():
+    provider = StubProvider()
+    batcher = make_batcher(provider)
+
+    assert batcher.embed_query("7") == [7.0]
+    assert provider.calls == [(["7"], QUERY_TASK_TYPE)]
+
+
+def test_input_error_only_fails_the_callers_of_the_bad_text():
+    provider = StubProvider(rejected={"13"})
+    batcher = make_batcher(provider, max_batch_size=8, max_wait=5, max_split_depth=3)
+    groups = [[str(caller * 10 + i) for i in range(4)] for caller in range(2)]
+
+    results, errors = run_concurrently(batcher, groups)
+
+    assert list(errors) == [1] and is_input_error(errors[1])
+    assert results[0] == [[float(text)] for text in groups[0]]
+    # Input errors are split, never retried: 8 -> 4 -> 2 -> 1 texts
+    assert len(provider.calls) == 1 + 2 + 2 + 2
+
+
+def test_split_depth_is_capped():
+    provider = StubProvider(rejected={str(i) for i in range(16)})
+    batcher = make_batcher(provider, max_batch_size=16, max_wait=5, max_split_depth=2)
+
+    results, errors = run_concurrently(batcher, [[str(i)] for i in range(16)])
+
+    assert len(errors) == 16
+    assert len(provider.calls) == 1 + 2 + 4
+
+
+@pytest.mark.parametrize("error", [ProviderError("429 rate limited", 429), ProviderError("503 unavailable", 503),
+                                   TimeoutError("timed out")])
+def test_transient_error_fails_the_whole_batch_without_splitting(error):
+    provider = StubProvider(error=error)
+    batcher = make_batcher(provider)
+
+    with pytest.raises(type(error)):
+        batcher.embed_documents([str(i) for i in range(100)])
+
+    # One call plus the retries, the batch is never split
+    assert len(provider.calls) == 3
+    assert all(len(texts) == 100 for texts, _ in provider.calls)
+
+
+def test_wrapped_input_error_is_recognised():
+    try:
+        try:
+            raise ProviderError("400 invalid argument", 400)
+        except ProviderError as e:
+            raise RuntimeError("Error embedding content") from e
+    except RuntimeError as wrapped:
+        assert is_input_error(wrapped)
+
+    assert not is_input_error(ProviderError("429 rate limited", 429))
+
+
+def test_wrong_number_of_vectors_fails_every_caller():
+    provider = StubProvider(drop_one=True)
+    batcher = make_batcher(provider, max_batch_size=3, max_wait=5)
+
+    results, errors = run_concurrently(batcher, [["1", "2"], ["3"]])
+
+    assert not results and len(errors) == 2
+    assert all(str(e) == "Expected 3 embeddings, got 2" for e in errors.values())
+    # Retried like any provider failure, but never split
+    assert len(provider.calls) == 3
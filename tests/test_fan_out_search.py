@@ -0,0 +1,59 @@
+import pytest
+from langchain.schema import Document
+
+helper_functions = pytest.importorskip("helper_functions")
+
+
+class StubEmbeddings:
+    def embed_query(self, query):
+        return [0.0, 1.0]
+
+
+def stub_indexes(monkeypatch, hits):
+    """
+    Serves hits[(index_id, category)] from every tenant search and records the searches run.
+    """
+    searches = []
+
+    class StubTenantIndex:
+        def __init__(self, user_id, embeddings_model):
+            self.user_id = str(user_id)
+
+        def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, fetch_k=20):
+            category = filter["category"] if filter else None
+            searches.append((self.user_id, category))
+            return hits.get((self.user_id, category), [])
+
+    monkeypatch.setattr(helper_functions, "get_embeddings_model", StubEmbeddings)
+    monkeypatch.setattr(helper_functions, "TenantIndex", StubTenantIndex)
+    return searches
+
+
+def doc(text, chat_num="1"):
+    return Document(page_content=text, metadata={"chat_num": chat_num})
+
+
+def test_hits_are_merged_by_score(monkeypatch):
+    stub_indexes(monkeypatch, {
+        ("1", "notes"): [(doc("a"), 0.1), (doc("c"), 0.5)],
+        ("1", "linkedin"): [(doc("b"), 0.3)],
+        ("team", "notes"): [(doc("d"), 0.2), (doc("e"), 0.9)],
+    })
+
+    docs = helper_functions.fan_out_search("q", ["1", "team"], ["notes", "linkedin"], k=4)
+
+    assert [d.page_content for d in docs] == ["a", "d", "b", "c"]
+
+
+def test_overlapping_searches_return_each_chunk_once(monkeypatch):
+    shared = doc("same chunk")
+    searches = stub_indexes(monkeypatch, {
+        ("1", None): [(shared, 0.1), (doc("other"), 0.4)],
+        ("1", "notes"): [(Document(page_content="same chunk", metadata={"chat_num": "1"}), 0.1)],
+    })
+
+    docs = helper_functions.fan_out_search("q", [1, "1"], [None, "notes", "notes"])
+
+    assert [d.page_content for d in docs] == ["same chunk", "other"]
+    # Repeated index ids and categories are searched once
+    assert sorted(searches, key=str) == [("1", "notes"), ("1", None)]
@@ -0,0 +1,81 @@
+import pytest
+
+import index_vacuum
+import sharded_store
+from sharded_store import delete_tenant_documents, get_shard
+from warm_set import WarmSet
+
+
+@pytest.fixture(autouse=True)
+def shard_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharded_store, "SHARD_ROOT", str(tmp_path))
+    monkeypatch.setattr(sharded_store, "NUM_SHARDS", 1)
+    for name in ("warm_segments", "warm_tenants"):
+        warm = getattr(sharded_store, name)
+        monkeypatch.setattr(sharded_store, name, WarmSet(1 << 30, 3600, warm.size_of))
+    monkeypatch.setattr(index_vacuum, "_pending_shards", set())
+    return tmp_path
+
+
+def add(user_id, ids, chat_num):
+    get_shard(0).add_embeddings(
+        user_id,
+        [f"text {doc_id}" for doc_id in ids],
+        [[float(i), 0.0] for i, _ in enumerate(ids)],
+        [{"chat_num": chat_num} for _ in ids],
+        ids
+    )
+
+
+def test_shard_below_the_threshold_stays_pending(monkeypatch):
+    monkeypatch.setattr(sharded_store, "MAX_INGEST_SEGMENTS", 0)
+    add("1", ["a", "b", "c", "d", "e"], chat_num="1")
+    add("1", ["f"], chat_num="2")
+    assert sharded_store.vacuum_shard(0) == 0  # Merges the ingest segments
+    delete_tenant_documents("1", "2")
+    index_vacuum.schedule_vacuum("1")
+
+    # 1 deleted vector out of 6 is under the threshold
+    assert index_vacuum.run_vacuum_pass(threshold=0.2) == 0
+    assert index_vacuum._pending_shards == {0}
+
+    delete_tenant_documents("1", "1")
+    assert index_vacuum.run_vacuum_pass(threshold=0.2) == 6
+    assert index_vacuum._pending_shards == set()
+    assert get_shard(0).segments() == []
+
+
+def test_ingest_segments_are_merged_once_there_are_too_many(monkeypatch):
+    monkeypatch.setattr(sharded_store, "MAX_INGEST_SEGMENTS", 2)
+    for chat_num in "123":
+        add("1", [f"doc{chat_num}"], chat_num=chat_num)
+        index_vacuum.schedule_vacuum("1")
+
+    assert index_vacuum.run_vacuum_pass() == 0
+
+    assert [kind for _, kind, _, _ in get_shard(0).segments()] == ["packed"]
+    assert index_vacuum._pending_shards == set()
+
+
+def test_failed_vacuum_stays_pending(monkeypatch):
+    def fail(shard_id, threshold):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(index_vacuum, "vacuum_shard", fail)
+    index_vacuum.schedule_vacuum("1")
+
+    assert index_vacuum.run_vacuum_pass() == 0
+    assert index_vacuum._pending_shards == {0}
+
+
+def test_existing_shards_start_pending(monkeypatch):
+    add("1", ["a"], chat_num="1")
+    monkeypatch.setattr(index_vacuum, "_worker", object())
+    monkeypatch.setattr(index_vacuum, "_vacuum_loop", lambda: None)
+
+    # An already started worker does not rescan the disk
+    index_vacuum.start_vacuum_worker()
+    assert index_vacuum._pending_shards == set()
+
+    monkeypatch.setattr(index_vacuum, "_worker", None)
+    index_vacuum.start_vacuum_worker()
+    assert index_vacuum._pending_shards == {0}
@@ -0,0 +1,34 @@
+import pytest
+
+PLAYLIST = {"url": "https://www.youtube.com/playlist?list=PL1", "user_id": "1", "category": "videos"}
+
+
+@pytest.fixture
+def resolved_limits(app_module, monkeypatch):
+    limits = []
+
+    def resolve_video_urls(url, max_videos):
+        limits.append(max_videos)
+        return []
+
+    monkeypatch.setattr(app_module, "resolve_video_urls", resolve_video_urls)
+    monkeypatch.setattr(app_module, "fetch_captions_bulk", lambda video_urls: ({}, []))
+    return limits
+
+
+@pytest.mark.parametrize("max_videos", ["abc", "2.5", 2.5, 0, -3, "0", True, None, [5]])
+def test_max_videos_must_be_a_positive_integer(client, resolved_limits, max_videos):
+    response = client.post("/update_yt_playlist_vdb", json={**PLAYLIST, "max_videos": max_videos})
+
+    assert response.status_code == 400
+    assert "max_videos" in response.get_json()["error"]
+    assert not resolved_limits
+
+
+def test_max_videos_is_capped(app_module, client, resolved_limits):
+    client.post("/update_yt_playlist_vdb", json={**PLAYLIST, "max_videos": "3"})
+    client.post("/update_yt_playlist_vdb", json={**PLAYLIST, "max_videos": 10 ** 6})
+    client.post("/update_yt_playlist_vdb", json=PLAYLIST)
+
+    cap = app_module.YOUTUBE_MAX_PLAYLIST_VIDEOS
+    assert resolved_limits == [min(3, cap), cap, cap]
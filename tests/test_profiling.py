@@ -0,0 +1,89 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import Flask
+
+import profiling
+
+TOKEN = "s3cret"
+
+
+def make_app():
+    app = Flask(__name__)
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="faiss-search")
+
+    def search_in_worker():
+        time.sleep(0.1)
+
+    @app.route("/response", methods=["POST"])
+    def response():
+        pool.submit(search_in_worker).result()
+        return "ok"
+
+    profiling.init_profiling(app)
+    return app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", TOKEN)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setattr(profiling, "PROFILE_ROUTES", {"/response"})
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0)
+    return make_app().test_client()
+
+
+def test_nothing_is_registered_without_a_token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", None)
+
+    app = make_app()
+
+    assert not app.before_request_funcs and not app.after_request_funcs and not app.teardown_request_funcs
+    assert not [rule for rule in app.url_map.iter_rules() if rule.rule.startswith("/profiles")]
+    assert app.test_client().get("/profiles").status_code == 404
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Profile": "wrong"}, {"X-Profile": "s3cr\u00e9t"}])
+def test_profiles_need_the_token(client, headers):
+    assert client.get("/profiles", headers=headers).status_code == 403
+    assert client.get("/profiles/x.collapsed", headers=headers).status_code == 403
+
+
+def test_request_without_the_token_is_not_profiled(client):
+    response = client.post("/response", headers={"X-Profile": "s3cr\u00e9t"})
+
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+
+
+def test_profiled_request_records_its_stacks_and_the_workers(client):
+    response = client.post("/response", headers={"X-Profile": TOKEN})
+
+    profile_id = response.headers["X-Profile-Id"]
+    assert profile_id.endswith(".collapsed")
+    assert os.path.exists(os.path.join(profiling.PROFILE_DIR, profile_id))
+    assert client.get("/profiles", headers={"X-Profile": TOKEN}).get_json() == [profile_id]
+
+    stacks = client.get(f"/profiles/{profile_id}", headers={"X-Profile": TOKEN}).get_data(as_text=True)
+    assert "response (test_profiling.py" in stacks
+    assert any(
+        line.startswith("faiss-search;") and "search_in_worker" in line for line in stacks.splitlines()
+    )
+
+
+def test_old_profiles_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_MAX_FILES", 2)
+
+    written = []
+    for age in (30, 20, 10):
+        written.append(profiling.write_profile("/response", Counter({"main": 1})))
+        path = os.path.join(tmp_path, written[-1])
+        os.utime(path, (time.time() - age, time.time() - age))
+
+    newest = profiling.write_profile("/response", Counter({"main": 1}))
+
+    assert sorted(os.listdir(tmp_path)) == sorted([written[2], newest])
@@ -0,0 +1,37 @@
+import pytest
+
+
+@pytest.fixture
+def searches(app_module, monkeypatch):
+    calls = []
+
+    def fan_out_search(query, index_ids, categories=None):
+        calls.append((query, index_ids, categories))
+        return []
+
+    monkeypatch.setattr(app_module, "fan_out_search", fan_out_search)
+    monkeypatch.setattr(app_module, "answer_from_documents", lambda query, docs: "answer")
+    monkeypatch.setattr(app_module, "SHARED_INDEX_IDS", {"team"})
+    return calls
+
+
+def test_user_may_search_its_own_and_shared_indexes(client, searches):
+    response = client.post("/response", json={"user_id": "1", "query": "q", "index_ids": ["1", "team"]})
+
+    assert response.status_code == 200 and response.get_json() == "answer"
+    assert searches == [("q", ["1", "team"], None)]
+
+
+def test_index_outside_the_shared_ids_is_forbidden(client, searches):
+    response = client.post("/response", json={"user_id": "1", "query": "q", "index_ids": ["1", "2"]})
+
+    assert response.status_code == 403
+    assert not searches
+
+
+@pytest.mark.parametrize("categories", [[{"a": 1}], [["notes"]], [None], "notes"])
+def test_categories_must_be_a_list_of_strings(client, searches, categories):
+    response = client.post("/response", json={"user_id": "1", "query": "q", "categories": categories})
+
+    assert response.status_code == 400
+    assert not searches
@@ -0,0 +1,31 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def index_not_ready(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "chat_history_fts_ready", False)
+
+
+def test_search_before_any_chat_history_is_empty(client):
+    response = client.get("/search_chat?userid=7&q=password&page=2&page_size=5")
+
+    assert response.status_code == 200
+    assert response.get_json() == {"results": [], "page": 2, "page_size": 5, "has_more": False}
+
+
+def test_index_is_created_once_chat_history_exists(app_module, client):
+    connection = sqlite3.connect(app_module.DATABASE)
+    connection.execute(
+        "CREATE TABLE chat_history (uid INTEGER PRIMARY KEY, user_id INTEGER, chat_id INTEGER, "
+        "question TEXT, answer TEXT, time_stamp DATETIME)"
+    )
+    connection.execute("INSERT INTO chat_history VALUES (1, 7, 1, 'reset my password', 'Use the link', '')")
+    connection.commit()
+    connection.close()
+
+    response = client.get("/search_chat?userid=7&q=password")
+
+    assert response.status_code == 200
+    assert [result["question"] for result in response.get_json()["results"]] == ["reset my password"]
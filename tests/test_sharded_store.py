@@ -0,0 +1,208 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+import sharded_store
+from dedup import DUPLICATE_SOURCES, simhash
+from sharded_store import delete_tenant_documents, get_shard, vacuum_shard
+from warm_set import WarmSet
+
+
+@pytest.fixture(autouse=True)
+def shard_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharded_store, "SHARD_ROOT", str(tmp_path))
+    monkeypatch.setattr(sharded_store, "NUM_SHARDS", 1)
+    for name in ("warm_segments", "warm_tenants"):
+        warm = getattr(sharded_store, name)
+        monkeypatch.setattr(sharded_store, name, WarmSet(1 << 30, 3600, warm.size_of))
+    return tmp_path
+
+
+def add(user_id, ids, chat_num="1", category="notes", metadata=None, references=None):
+    get_shard(0).add_embeddings(
+        user_id,
+        [f"text {doc_id}" for doc_id in ids],
+        [[float(ord(doc_id[0])), float(i)] for i, doc_id in enumerate(ids)],
+        [{"chat_num": chat_num, "source": f"src{chat_num}", "category": category, **(metadata or {})}
+         for _ in ids],
+        ids,
+        references
+    )
+
+
+def search(user_id, k=10, filter=None):
+    return [doc.page_content for doc, _ in get_shard(0).search(user_id, [0.0, 0.0], k=k, filter=filter)]
+
+
+def segment_files():
+    return sorted(name for name in os.listdir(sharded_store.shard_path(0)) if name.endswith(".faiss"))
+
+
+def metadata(doc_id):
+    with sqlite3.connect(os.path.join(sharded_store.shard_path(0), sharded_store.SHARD_DB)) as connection:
+        row = connection.execute("SELECT metadata FROM chunks WHERE doc_id = ?", (doc_id,)).fetchone()
+    return None if row is None else json.loads(row[0])
+
+
+def test_search_only_sees_the_tenant_vectors():
+    add("1", ["a", "b"])
+    add("2", ["c"])
+    add("1", ["d"], category="linkedin")
+
+    assert search("1") == ["text a", "text b", "text d"]
+    assert search("2") == ["text c"]
+    assert search("1", filter={"category": "linkedin"}) == ["text d"]
+    assert search("3") == []
+
+
+def test_each_ingest_appends_a_segment_and_leaves_the_others_untouched():
+    add("1", ["a"])
+    first = segment_files()
+    mtime = os.stat(os.path.join(sharded_store.shard_path(0), first[0])).st_mtime_ns
+
+    add("2", ["b"])
+
+    assert len(segment_files()) == 2 and first[0] in segment_files()
+    assert os.stat(os.path.join(sharded_store.shard_path(0), first[0])).st_mtime_ns == mtime
+
+
+def test_failed_ingest_publishes_nothing():
+    add("1", ["a"])
+
+    with pytest.raises(sqlite3.IntegrityError):
+        add("1", ["b", "a"])
+
+    assert search("1") == ["text a"]
+    assert len(segment_files()) == 1
+
+
+def test_delete_removes_the_chunks_and_leaves_the_vectors_to_the_vacuum():
+    add("1", ["a", "b"], chat_num="1")
+    add("1", ["c"], chat_num="2")
+    files = segment_files()
+    assert search("1") == ["text a", "text b", "text c"]
+
+    assert delete_tenant_documents("1", "1") == 2
+
+    assert search("1") == ["text c"]
+    assert metadata("a") is None and metadata("b") is None
+    assert segment_files() == files
+    assert sorted(live for _, _, _, live in get_shard(0).segments()) == [0, 1]
+
+    assert vacuum_shard(0) == 2
+    assert search("1") == ["text c"]
+    assert len(segment_files()) == 1
+    assert vacuum_shard(0) == 0
+
+
+def test_writes_from_another_process_are_seen_on_the_next_search():
+    add("1", ["a", "b"])
+    assert search("1") == ["text a", "text b"]
+
+    # What another process deleting a chunk does to the shard database
+    with sqlite3.connect(os.path.join(sharded_store.shard_path(0), sharded_store.SHARD_DB)) as connection:
+        connection.execute("DELETE FROM chunks WHERE doc_id = 'a'")
+        connection.execute("UPDATE tenants SET version = version + 1 WHERE user_id = '1'")
+
+    assert get_shard(0).tenant_ids("1") == {"b"}
+    assert search("1") == ["text b"]
+
+
+def test_compaction_merges_ingest_segments_and_isolates_large_tenants(monkeypatch):
+    monkeypatch.setattr(sharded_store, "MAX_INGEST_SEGMENTS", 2)
+    monkeypatch.setattr(sharded_store, "TENANT_SEGMENT_VECTORS", 3)
+    add("1", ["a", "b"])
+    add("2", ["c"])
+    add("3", ["d"])
+    add("1", ["e"])
+    before = {user_id: search(user_id) for user_id in "123"}
+
+    assert vacuum_shard(0, threshold=0.2) == 0
+
+    kinds = sorted((kind, size) for _, kind, size, _ in get_shard(0).segments())
+    assert kinds == [("packed", 2), ("tenant", 3)]
+    assert len(segment_files()) == 2
+    assert {user_id: search(user_id) for user_id in "123"} == before
+
+
+def test_search_loads_only_the_tenant_segments(monkeypatch):
+    monkeypatch.setattr(sharded_store, "MAX_INGEST_SEGMENTS", 0)
+    monkeypatch.setattr(sharded_store, "TENANT_SEGMENT_VECTORS", 2)
+    add("1", ["a", "b"])
+    add("2", ["c"])
+    vacuum_shard(0)
+    monkeypatch.setattr(sharded_store, "warm_segments", WarmSet(1 << 30, 3600, sharded_store.warm_segments.size_of))
+
+    assert search("2") == ["text c"]
+
+    assert [name.split("_")[0] for _, name in sharded_store.warm_segments._entries] == ["packed"]
+
+
+def test_segment_over_budget_is_loaded_once(monkeypatch):
+    add("1", ["a", "b"])
+    monkeypatch.setattr(sharded_store, "warm_segments", WarmSet(1, 3600, sharded_store.warm_segments.size_of))
+
+    loads = []
+    read_index = sharded_store.faiss.read_index
+    monkeypatch.setattr(sharded_store.faiss, "read_index", lambda path: loads.append(path) or read_index(path))
+
+    for _ in range(5):
+        get_shard(0).search("1", [0.0, 0.0])
+    assert len(loads) == 1
+
+
+def test_fingerprints_are_scoped_to_a_category_and_stored(monkeypatch):
+    add("1", ["a"], category="notes", metadata={"simhash": 42})
+    add("1", ["b"], category="linkedin")
+    shard = get_shard(0)
+
+    assert shard.tenant_fingerprints("1", "notes") == {"a": 42}
+    assert shard.tenant_fingerprints("1", "linkedin") == {"b": simhash("text b")}
+    assert metadata("b")["simhash"] == simhash("text b")
+
+    monkeypatch.setattr(sharded_store, "simhash", lambda text: pytest.fail("fingerprint recomputed"))
+    assert shard.tenant_fingerprints("1", "linkedin") == {"b": simhash("text b")}
+
+
+def test_references_are_written_with_the_ingest():
+    add("1", ["a"], chat_num="1")
+
+    add("1", ["b"], chat_num="2", references={"a": [{"chat_num": "2", "source": "src2"}]})
+
+    assert metadata("a")[DUPLICATE_SOURCES] == [{"chat_num": "2", "source": "src2"}]
+
+
+def test_failed_ingest_records_no_reference():
+    add("1", ["a"], chat_num="1")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        add("1", ["a"], chat_num="2", references={"a": [{"chat_num": "2", "source": "src2"}]})
+
+    assert DUPLICATE_SOURCES not in metadata("a")
+    assert delete_tenant_documents("1", "1") == 1
+    assert search("1") == []
+
+
+def test_deleting_a_source_hands_shared_chunks_over():
+    add("1", ["a", "b"], chat_num="1")
+    add("1", [], references={"a": [{"chat_num": "2", "source": "src2"}]})
+
+    assert delete_tenant_documents("1", "1") == 2
+
+    assert search("1") == ["text a"]
+    assert metadata("a")["chat_num"] == "2" and metadata("a")["source"] == "src2"
+    assert metadata("a")[DUPLICATE_SOURCES] == []
+
+    assert delete_tenant_documents("1", "2") == 1
+    assert search("1") == []
+
+
+def test_deleting_a_referenced_source_drops_the_reference():
+    add("1", ["a"], chat_num="1")
+    add("1", [], references={"a": [{"chat_num": "2", "source": "src2"}]})
+
+    assert delete_tenant_documents("1", "2") == 0
+
+    assert metadata("a")["chat_num"] == "1" and metadata("a")[DUPLICATE_SOURCES] == []
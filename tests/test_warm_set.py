@@ -0,0 +1,47 @@
+import time
+
+from warm_set import WarmSet
+
+
+def make_warm_set(budget=100, idle_ttl=60):
+    return WarmSet(budget, idle_ttl, size_of=len)
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    warm = make_warm_set()
+    warm.put("a", "x" * 40)
+    warm.put("b", "x" * 40)
+    warm.get("a")
+
+    warm.put("c", "x" * 40)
+
+    assert warm.get("b") is None
+    assert warm.get("a") and warm.get("c")
+    assert warm.used_bytes == 80
+
+
+def test_entry_over_budget_is_kept_alone():
+    warm = make_warm_set()
+    warm.put("a", "x" * 40)
+
+    warm.put("huge", "x" * 150)
+
+    assert warm.get("huge") == "x" * 150
+    assert warm.get("a") is None
+
+    # The next entry evicts it again
+    warm.put("b", "x" * 10)
+    assert warm.get("huge") is None and warm.get("b")
+    assert warm.used_bytes == 10
+
+
+def test_idle_entries_expire():
+    warm = make_warm_set(idle_ttl=0.05)
+    warm.put("idle", "old")
+    time.sleep(0.1)
+    warm.put("fresh", "new")
+
+    assert warm.expire_idle() == 1
+
+    assert warm.get("idle") is None and warm.get("fresh") == "new"
+    assert warm.used_bytes == 3
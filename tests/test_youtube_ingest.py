@@ -0,0 +1,128 @@
+import pytest
+
+from youtube_ingest import (
+    NO_ENGLISH_CAPTIONS, CaptionCache, NoEnglishCaptionsError, fetch_captions, fetch_captions_bulk, pick_english_caption,
+    resolve_video_urls
+)
+
+
+def video_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+class StubCaption:
+    def __init__(self, code, text=None):
+        self.code = code
+        self.text = text or f"captions {code}"
+
+    def generate_srt_captions(self):
+        return self.text
+
+
+def stub_youtube(captions_by_url):
+    """
+    Returns a YouTube client stub serving the given caption tracks and recording the URLs opened.
+    """
+    opened = []
+
+    class StubYouTube:
+        def __init__(self, url):
+            opened.append(url)
+            self.captions = {caption.code: caption for caption in captions_by_url[url]}
+
+    StubYouTube.opened = opened
+    return StubYouTube
+
+
+def stub_listing(video_urls):
+    class StubListing:
+        def __init__(self, url):
+            self.video_urls = video_urls
+    return StubListing
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CaptionCache(str(tmp_path))
+
+
+def captions(*codes):
+    return {code: StubCaption(code) for code in codes}
+
+
+@pytest.mark.parametrize("codes, expected", [
+    (["a.en", "en-GB", "en"], "en"),
+    (["a.en", "en-IN"], "en-IN"),
+    (["e.in", "a.en"], "e.in"),
+    (["a.en-US", "a.en"], "a.en"),
+    (["fr", "en-AU"], "en-AU"),
+    (["fr", "a.en-AU"], "a.en-AU"),
+])
+def test_pick_english_caption_fallback_order(codes, expected):
+    assert pick_english_caption(captions(*codes)).code == expected
+
+
+def test_pick_english_caption_without_english():
+    assert pick_english_caption(captions("fr", "de", "a.es")) is None
+
+
+def test_fetch_captions_caches_the_text(cache):
+    url = video_url("aaaaaaaaaaa")
+    client = stub_youtube({url: [StubCaption("en", "hello")]})
+
+    assert fetch_captions(url, client, cache) == "hello"
+    assert fetch_captions(url, client, cache) == "hello"
+
+    assert client.opened == [url]
+    assert cache.get("aaaaaaaaaaa") == "hello"
+
+
+def test_cache_hit_skips_the_client(cache):
+    cache.put("bbbbbbbbbbb", "cached")
+
+    def client(url):
+        raise AssertionError("YouTube client called on a cache hit")
+
+    assert fetch_captions(video_url("bbbbbbbbbbb"), client, cache) == "cached"
+
+
+def test_fetch_captions_without_english(cache):
+    url = video_url("ccccccccccc")
+    with pytest.raises(NoEnglishCaptionsError):
+        fetch_captions(url, stub_youtube({url: [StubCaption("fr")]}), cache)
+    assert cache.get("ccccccccccc") is None
+
+
+def test_resolve_playlist_dedups_and_caps():
+    urls = [video_url(c * 11) for c in "abcab" + "defgh"]
+    playlist = stub_listing(urls)
+
+    def channel(url):
+        raise AssertionError("playlist URL opened as a channel")
+
+    resolved = resolve_video_urls("https://www.youtube.com/playlist?list=PL123", 4, playlist, channel)
+
+    assert resolved == [video_url(c * 11) for c in "abcd"]
+
+
+def test_resolve_channel():
+    urls = [video_url("a" * 11), video_url("b" * 11), video_url("a" * 11)]
+    channel = stub_listing(urls)
+
+    assert resolve_video_urls("https://www.youtube.com/@someone", 10, None, channel) == urls[:2]
+
+
+def test_resolve_single_video():
+    url = video_url("a" * 11)
+    assert resolve_video_urls(url, 10, None, None) == [url]
+
+
+def test_fetch_captions_bulk_splits_captions_and_skipped(cache):
+    good, french, broken = video_url("g" * 11), video_url("f" * 11), video_url("x" * 11)
+    client = stub_youtube({good: [StubCaption("a.en", "good")], french: [StubCaption("fr")]})
+
+    found, skipped = fetch_captions_bulk([good, french, broken], 2, client, cache)
+
+    assert found == {good: "good"}
+    assert set(skipped) == {french, broken}
+    assert skipped[french] == NO_ENGLISH_CAPTIONS
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Memory the warm set may hold before it evicts the least recently used entries
+WARM_SET_BUDGET = int(float(os.getenv("WARM_SET_BUDGET_MB", "1024")) * 1024 * 1024)
+
+# Seconds without access after which an entry expires
+WARM_SET_IDLE_TTL = float(os.getenv("WARM_SET_IDLE_SECONDS", "1800"))
+
+# Seconds between two sweeps for idle entries
+WARM_SET_SWEEP_INTERVAL = float(os.getenv("WARM_SET_SWEEP_SECONDS", "60"))
+
+
+class WarmSet:
+    """
+    In-process LRU cache bounded by an estimated memory budget, whose entries also expire
+    after a period without access.
+
+    An entry larger than the whole budget is still kept, alone, so it is not reloaded on every
+    access; the next entry put evicts it.
+    """
+
+    def __init__(self, budget_bytes: int, idle_ttl: float, size_of: Callable[[Any], int]):
+        self.budget_bytes = budget_bytes
+        self.idle_ttl = idle_ttl
+        self.size_of = size_of
+        self.used_bytes = 0
+
+        # key -> (value, size, last access), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, size, last_access = entry
+            if time.monotonic() - last_access > self.idle_ttl:
+                self._remove(key)
+                return None
+
+            self._entries[key] = (value, size, time.monotonic())
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.size_of(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            if size > self.budget_bytes:
+                print(f"Warm set entry {key} needs {size} bytes, over the {self.budget_bytes} byte budget: "
+                      f"keeping it alone.")
+
+            while self._entries and self.used_bytes + size > self.budget_bytes:
+                self._remove(next(iter(self._entries)))
+
+            self._entries[key] = (value, size, time.monotonic())
+            self.used_bytes += size
+
+    def expire_idle(self) -> int:
+        """
+        Removes every entry idle for longer than the TTL.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, (_, _, last_access) in self._entries.items() if now - last_access > self.idle_ttl]
+            for key in idle:
+                self._remove(key)
+        return len(idle)
+
+    def start_sweeper(self, interval: float = WARM_SET_SWEEP_INTERVAL) -> None:
+        """
+        Starts a background thread expiring idle entries every `interval` seconds (idempotent).
+        """
+        def sweep():
+            while True:
+                time.sleep(interval)
+                self.expire_idle()
+
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=sweep, name="warm-set-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def _remove(self, key: Hashable) -> None:
+        # Called with the lock held
+        _, size, _ = self._entries.pop(key)
+        self.used_bytes -= size
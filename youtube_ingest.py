@@ -0,0 +1,174 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from pytubefix import Channel, Playlist, YouTube
+from pytubefix.extract import video_id as extract_video_id
+
+# English caption tracks in order of preference ("a." marks auto-generated tracks)
+ENGLISH_CAPTION_CODES = ("en", "en-IN", "e.in", "en-US", "en-GB", "a.en", "a.en-IN", "a.en-US", "a.en-GB")
+
+# Directory holding one caption file per video id
+CAPTION_CACHE_DIR = os.getenv("CAPTION_CACHE_DIR", "caption_cache")
+
+# Caption downloads allowed to run at the same time during a playlist ingest
+YOUTUBE_FETCH_WORKERS = int(os.getenv("YOUTUBE_FETCH_WORKERS", "4"))
+
+# Upper bound on the number of videos taken from one playlist or channel
+YOUTUBE_MAX_PLAYLIST_VIDEOS = int(os.getenv("YOUTUBE_MAX_PLAYLIST_VIDEOS", "200"))
+
+NO_ENGLISH_CAPTIONS = "Please provide a YouTube video that has English subtitles."
+
+CHANNEL_URL_PATTERN = re.compile(r"youtube\.com/(@|channel/|c/|user/)")
+
+
+class NoEnglishCaptionsError(ValueError):
+    """
+    Raised when a video has no English caption track.
+    """
+
+
+class CaptionCache:
+    """
+    On-disk cache of caption text keyed by video id, so re-ingesting a video (alone or as
+    part of overlapping playlists) never hits the network again.
+    """
+
+    def __init__(self, directory: str = CAPTION_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, video_id: str) -> str:
+        return os.path.join(self.directory, f"{video_id}.srt")
+
+    def get(self, video_id: str) -> Optional[str]:
+        try:
+            with open(self._path(video_id), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, video_id: str, text: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(video_id) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self._path(video_id))
+
+
+caption_cache = CaptionCache()
+
+
+def pick_english_caption(captions):
+    """
+    Picks the preferred English caption track, falling back to any English variant.
+
+    Args:
+        captions: The video's caption tracks (a pytubefix CaptionQuery or a dict keyed by code).
+
+    Returns:
+        The chosen caption track, or None if the video has no English captions.
+    """
+    for code in ENGLISH_CAPTION_CODES:
+        if code in captions:
+            return captions[code]
+
+    for caption in (captions.values() if isinstance(captions, dict) else captions):
+        code = caption.code.lower()
+        if code.removeprefix("a.").startswith("en"):
+            return caption
+
+    return None
+
+
+def fetch_captions(url: str, youtube_client=YouTube, cache: CaptionCache = caption_cache) -> str:
+    """
+    Returns the English captions of a video in SRT format, from the cache when possible.
+
+    Args:
+        url (str): The YouTube video URL.
+        youtube_client: Class used to open the video, replaceable by a stub in tests.
+        cache (CaptionCache, optional): The caption cache.
+
+    Returns:
+        str: The caption text.
+
+    Raises:
+        NoEnglishCaptionsError: If the video has no English caption track.
+    """
+    video_id = extract_video_id(url)
+    cached = cache.get(video_id)
+    if cached is not None:
+        return cached
+
+    caption = pick_english_caption(youtube_client(url).captions)
+    if caption is None:
+        raise NoEnglishCaptionsError(NO_ENGLISH_CAPTIONS)
+
+    text = caption.generate_srt_captions()
+    cache.put(video_id, text)
+    return text
+
+
+def resolve_video_urls(url: str, max_videos: int = YOUTUBE_MAX_PLAYLIST_VIDEOS,
+                       playlist_client=Playlist, channel_client=Channel) -> List[str]:
+    """
+    Expands a playlist or channel URL into the URLs of its videos.
+
+    Args:
+        url (str): A playlist, channel or single video URL.
+        max_videos (int, optional): Maximum number of videos to return.
+        playlist_client: Class used to open playlists, replaceable by a stub in tests.
+        channel_client: Class used to open channels, replaceable by a stub in tests.
+
+    Returns:
+        List[str]: The video URLs, without duplicates.
+    """
+    if "list=" in url:
+        video_urls = playlist_client(url).video_urls
+    elif CHANNEL_URL_PATTERN.search(url):
+        video_urls = channel_client(url).video_urls
+    else:
+        video_urls = [url]
+
+    unique_urls = []
+    for video_url in video_urls:
+        if video_url not in unique_urls:
+            unique_urls.append(video_url)
+        if len(unique_urls) >= max_videos:
+            break
+
+    return unique_urls
+
+
+def fetch_captions_bulk(video_urls: List[str], max_workers: int = YOUTUBE_FETCH_WORKERS,
+                        youtube_client=YouTube, cache: CaptionCache = caption_cache
+                        ) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Fetches the captions of many videos concurrently with bounded parallelism.
+
+    Args:
+        video_urls (List[str]): The video URLs.
+        max_workers (int, optional): Maximum number of downloads running at the same time.
+        youtube_client: Class used to open videos, replaceable by a stub in tests.
+        cache (CaptionCache, optional): The caption cache.
+
+    Returns:
+        Tuple[Dict[str, str], Dict[str, str]]: Captions keyed by URL, and errors keyed by URL
+        for the videos that could not be ingested.
+    """
+    def fetch(url):
+        try:
+            return url, fetch_captions(url, youtube_client, cache), None
+        except Exception as e:
+            return url, None, str(e)
+
+    captions, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yt-captions") as pool:
+        for url, text, error in pool.map(fetch, video_urls):
+            if error is None:
+                captions[url] = text
+            else:
+                errors[url] = error
+
+    return captions, errors